@@ -32,7 +32,8 @@ class ApprovePunishment(discord.ui.DynamicItem[discord.ui.Button], template='pun
 
         view = discord.ui.View()
         view.add_item(discord.ui.Button(label=interaction.user.display_name, emoji='\N{THUMBS UP SIGN}', disabled=True))
-        await db.actions.approve(self.action_id, interaction.user.id, interaction.client, interaction)
+        async with db.actions.unit_of_work():
+            await db.actions.approve(self.action_id, interaction.user.id, interaction.client, interaction)
 
         await interaction.message.edit(embed=embed, view=view)
         if not interaction.response.is_done():
@@ -65,7 +66,8 @@ class RejectPunishment(discord.ui.DynamicItem[discord.ui.Button], template='puni
             discord.ui.Button(label=interaction.user.display_name, emoji='\N{THUMBS DOWN SIGN}', disabled=True))
 
         punishments = interaction.client.get_cog('punishments')
-        await punishments.revert_action(interaction.user, self.action_id)
+        async with db.actions.unit_of_work():
+            await punishments.revert_action(interaction.user, self.action_id)
 
         await interaction.message.edit(embed=embed, view=view)
         await interaction.response.defer(ephemeral=True)
@@ -1,28 +1,23 @@
 import datetime
+import logging
+import time
 
 import aiohttp
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 
+import config
 from core.bot import Reverie
 from buttons.online import online_reload
 from core import autocompletes, security, templates
 from database import db
-from database.online.features import is_counting, is_date_valid
-from database.online.general import CurrentInfo
+from database.online.features import is_date_valid
+from database.online.general import DateInfo
+from database.online.reconcile import live_sessions
 
-
-class AbstractChannel:
-    def __init__(self, _id: int, name: str) -> None:
-        self.id = _id
-        self.name = name
-
-
-class AbstractUser:
-    def __init__(self, _id: int, guild: discord.Guild) -> None:
-        self.id = _id
-        self.guild = guild
+# tasks.loop без tzinfo считает время в UTC, расписание задано по МСК
+msk = datetime.timezone(datetime.timedelta(hours=3), 'MSK')
 
 
 class OnlineCog(commands.Cog):
@@ -30,6 +25,82 @@ class OnlineCog(commands.Cog):
         self.bot = bot
         self.db = db.online
         self.hassle_data: dict[str, None | dict | datetime.datetime] = {'last_update': None, 'data': None}
+        self.leaderboard_messages: dict[int, discord.Message] = {}
+
+    async def cog_load(self) -> None:
+        self.archive_loop.start()
+        self.checkpoint_loop.start()
+        self.leaderboard_loop.start()
+        self.maintenance_loop.start()
+
+    async def cog_unload(self) -> None:
+        self.archive_loop.cancel()
+        self.checkpoint_loop.cancel()
+        self.leaderboard_loop.cancel()
+        self.maintenance_loop.cancel()
+
+    @tasks.loop(time=datetime.time(hour=5, tzinfo=msk))
+    async def archive_loop(self) -> None:
+        archived = await self.db.archive_closed_months()
+        if archived:
+            logging.info(f'Online archive: moved {archived} (month: rows) out of SQLite')
+
+    @tasks.loop(time=datetime.time(hour=config.online_maintenance_hour, tzinfo=msk))
+    async def maintenance_loop(self) -> None:
+        if len(self.db.current) > config.online_maintenance_max_sessions:
+            logging.info(f'Online maintenance skipped: {len(self.db.current)} members in voice')
+            return
+        steps = await self.db.maintain(full_analyze=datetime.datetime.now(msk).weekday() == 6)
+        logging.info('Online maintenance: ' + '; '.join(map(str, steps)))
+
+    @tasks.loop(seconds=config.online_checkpoint_interval)
+    async def checkpoint_loop(self) -> None:
+        started = time.perf_counter()
+        try:
+            sessions = await self.db.checkpoint()
+        except Exception:
+            logging.exception('Voice checkpoint failed')
+            return
+        logging.debug(f'Voice checkpoint: {sessions} sessions in {(time.perf_counter() - started) * 1000:.1f}ms')
+
+    @tasks.loop(seconds=config.online_leaderboard_interval)
+    async def leaderboard_loop(self) -> None:
+        for guild in self.bot.guilds:
+            channel = next((channel for channel in guild.text_channels
+                            if any(query in channel.name for query in config.online_leaderboard_channels)), None)
+            if channel is None:
+                continue
+            try:
+                await self.update_leaderboard_message(channel)
+            except discord.HTTPException:
+                logging.exception(f'Failed to update voice leaderboard in {guild.id}')
+
+    @leaderboard_loop.before_loop
+    async def before_leaderboard_loop(self) -> None:
+        await self.bot.wait_until_ready()
+
+    async def update_leaderboard_message(self, channel: discord.TextChannel) -> None:
+        embed = self.leaderboard_embed(channel.guild)
+        message = self.leaderboard_messages.get(channel.guild.id)
+        if message is None:
+            message = next((pin for pin in await channel.pins()
+                            if pin.author == self.bot.user and pin.embeds and pin.embeds[0].title == embed.title), None)
+        if message is None or message.channel.id != channel.id:
+            message = await channel.send(embed=embed)
+            await message.pin()
+        else:
+            message = await message.edit(embed=embed)
+        self.leaderboard_messages[channel.guild.id] = message
+
+    def leaderboard_embed(self, guild: discord.Guild) -> discord.Embed:
+        embed = discord.Embed(title='🏆 Онлайн в открытых каналах', color=discord.Color.light_embed(), timestamp=discord.utils.utcnow())
+        for period, name in (('day', 'Сегодня'), ('week', 'Эта неделя')):
+            top = self.db.get_live_top(guild.id, period)
+            embed.add_field(name=name, value='\n'.join(
+                f'{index}. <@{user_id}>: {templates.time(seconds, display_hour=True)}' for index, (user_id, seconds) in enumerate(top, start=1)
+            ) or 'Нет активности.')
+        embed.set_footer(text='Информация обновлена')
+        return embed
 
     @app_commands.command(name='online', description='Показать онлайн пользователя')
     @app_commands.rename(user='пользователь', date='дата', is_open='открытые-каналы')
@@ -116,6 +187,11 @@ class OnlineCog(commands.Cog):
             message += f'{index}. <@{user_id}>: {templates.time(total_seconds, display_hour=True)}\n'
         await interaction.followup.send(message, ephemeral=True)
 
+    @app_commands.command(name='online-live', description='Живой топ по онлайну за сегодня и текущую неделю')
+    @app_commands.guild_only()
+    async def online_live(self, interaction: discord.Interaction):
+        await interaction.response.send_message(embed=self.leaderboard_embed(interaction.guild), ephemeral=True)
+
     async def update_hassle_data(self):
         if self.hassle_data['last_update'] and (datetime.datetime.now(datetime.UTC) - self.hassle_data['last_update']).seconds < 60:
             return
@@ -140,6 +216,28 @@ class OnlineCog(commands.Cog):
             embed.add_field(name=f'{index}', value=f'{online_data["players"]}/{online_data["maxPlayers"]}', inline=True)
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @app_commands.command(name='online-heatmap', description='Показать распределение онлайна по часам и дням недели')
+    @app_commands.rename(month='месяц', is_open='открытые-каналы', user='пользователь')
+    @app_commands.describe(
+        month='Месяц в формате mm.YYYY',
+        is_open='Подсчитывать онлайн только в открытых каналах.',
+        user='Пользователь, чей онлайн нужно показать. По умолчанию весь сервер'
+    )
+    @app_commands.autocomplete(month=autocompletes.month)
+    @app_commands.default_permissions(manage_nicknames=True)
+    @security.restricted(security.PermissionLevel.GMD)
+    async def online_heatmap(self, interaction: discord.Interaction, month: str, is_open: bool, user: discord.Member = None):
+        if not is_date_valid(month, '%m.%Y'):
+            raise ValueError('Неверный формат месяца. Формат: mm.YYYY.\nПример: 07.2077')
+
+        start_date = datetime.datetime.strptime(month, '%m.%Y').date()
+        end_date = (start_date + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        heatmap = await self.db.get_heatmap(interaction.guild.id, start_date, end_date, is_open, user.id if user else None)
+
+        embed = heatmap.to_embed(f'🔥 Активность за {month}')
+        embed.add_field(name='Пользователь' if user else 'Сервер', value=user.mention if user else interaction.guild.name, inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name='admin-online')
     @app_commands.default_permissions(administrator=True)
     @app_commands.rename(date='дата')
@@ -155,8 +253,9 @@ class OnlineCog(commands.Cog):
         date_obj = datetime.datetime.strptime(date, '%d.%m.%Y')
         administrators = security.administration(interaction.guild).members
 
+        online = await self.db.get_team_info([admin.id for admin in administrators], interaction.guild.id, date_obj, date_obj, is_open=True)
         stats = {
-            admin: await self.db.get_info(is_open=True, user_id=admin.id, guild_id=interaction.guild.id, date=date_obj.strftime('%Y-%m-%d'))
+            admin: online[admin.id].get(date_obj.strftime('%Y-%m-%d'), DateInfo([]))
             for admin in administrators
         }
 
@@ -175,11 +274,114 @@ class OnlineCog(commands.Cog):
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    async def join(self, member: discord.Member, channel: discord.VoiceChannel) -> None:
-        await self.db.add_join_info(member, channel, is_counting(channel))
+    online_admin = app_commands.Group(
+        name='online-admin',
+        description='Обслуживание базы онлайна',
+        guild_only=True,
+        default_permissions=discord.Permissions(administrator=True)
+    )
+
+    @online_admin.command(name='rebuild-top', description='Пересобрать помесячные итоги для топа по онлайну')
+    @app_commands.default_permissions(administrator=True)
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def rebuild_top(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        started = time.perf_counter()
+        rows = await self.db.rebuild_monthly()
+        await interaction.followup.send(
+            f'### Помесячные итоги пересобраны\nЗаписей: {rows}\nВремя: {time.perf_counter() - started:.2f} с.', ephemeral=True
+        )
+
+    @online_admin.command(name='archive', description='Перенести закрытые месяцы в архив')
+    @app_commands.default_permissions(administrator=True)
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def archive(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        archived = await self.db.archive_closed_months()
+        months = '\n'.join(f'{str(month)[4:]}.{str(month)[:4]}: {rows} записей' for month, rows in archived.items())
+        await interaction.followup.send(f'### Архивация онлайна\n{months or "Нет месяцев для архивации."}', ephemeral=True)
+
+    @online_admin.command(name='maintenance', description='Резервная копия, ANALYZE и очистка базы онлайна')
+    @app_commands.rename(full_analyze='полный-analyze', convert_vacuum='перевести-vacuum')
+    @app_commands.describe(convert_vacuum='Полный VACUUM в режим incremental auto_vacuum, запись онлайна стоит до его конца')
+    @app_commands.default_permissions(administrator=True)
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def maintenance(self, interaction: discord.Interaction, full_analyze: bool = False, convert_vacuum: bool = False):
+        await interaction.response.defer(ephemeral=True)
+        steps = await self.db.maintain(full_analyze, convert_vacuum)
+        await interaction.followup.send(
+            '### Обслуживание базы онлайна\n' + ('\n'.join(f'- {step}' for step in steps) or 'Хранилище не требует обслуживания.'),
+            ephemeral=True
+        )
+
+    @online_admin.command(name='pool', description='Статистика пула соединений для чтения')
+    @app_commands.default_permissions(administrator=True)
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def pool_stats(self, interaction: discord.Interaction):
+        stats = self.db.storage.stats()
+        embed = discord.Embed(title='🗄️ Пул чтения онлайна', color=discord.Color.light_embed(), timestamp=discord.utils.utcnow())
+        embed.add_field(name='Хранилище', value=self.db.storage.name, inline=False)
+        if stats is not None:
+            embed.add_field(name='Соединения', value=f'{stats.in_use}/{stats.size} занято')
+            embed.add_field(name='Запросов', value=str(stats.acquisitions))
+            embed.add_field(name='Ожидание', value=(f'среднее: {stats.average_wait * 1000:.1f} мс\n'
+                                                    f'p95: {stats.p95_wait * 1000:.1f} мс\n'
+                                                    f'макс.: {stats.max_wait * 1000:.1f} мс'), inline=False)
+        embed.add_field(name='Очередь записи', value=f'{len(self.db.events)} событий', inline=False)
+        cache = self.db.cache.stats()
+        embed.add_field(name='Кэш отчётов', value=(f'{cache.size} записей, попаданий: {cache.hit_rate:.0%}\n'
+                                                   f'hit: {cache.hits}, miss: {cache.misses}, объединено: {cache.coalesced}\n'
+                                                   f'сброшено: {cache.invalidations}, вытеснено: {cache.evictions}'), inline=False)
+        if self.db.checkpointed_at:
+            embed.add_field(name='Последний чекпоинт', value=discord.utils.format_dt(
+                datetime.datetime.fromtimestamp(self.db.checkpointed_at), 'R'), inline=False)
+        embed.set_footer(text='Информация обновлена')
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @online_admin.command(name='transfer', description='Скопировать онлайн в другое хранилище')
+    @app_commands.default_permissions(administrator=True)
+    @security.restricted(security.PermissionLevel.SPEC)
+    @app_commands.choices(backend=[
+        app_commands.Choice(name='SQLite', value='sqlite'),
+        app_commands.Choice(name='MongoDB', value='mongo'),
+    ])
+    async def transfer(self, interaction: discord.Interaction, backend: app_commands.Choice[str]):
+        await interaction.response.defer(ephemeral=True)
+        started = time.perf_counter()
+        try:
+            copied = await self.db.transfer(backend.value)
+        except ValueError as e:
+            return await interaction.followup.send(f'### Перенос не выполнен\n{e}', ephemeral=True)
+        rows = '\n'.join(f'{kind}: {count}' for kind, count in copied.items())
+        await interaction.followup.send(
+            f'### Онлайн скопирован в {backend.name}\n{rows}\nВремя: {time.perf_counter() - started:.2f} с.\n'
+            f'Чтобы переключиться, укажите `online_backend = \'{backend.value}\'` в конфиге и перезапустите бота.', ephemeral=True
+        )
+
+    @online_admin.command(name='channels', description='Классификация голосовых каналов для подсчёта онлайна')
+    @app_commands.default_permissions(administrator=True)
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def channels(self, interaction: discord.Interaction):
+        classified = self.db.classification.guild(interaction.guild.id)
+        counting = [f'<#{channel_id}>' for channel_id, flag in classified.items() if flag]
+        log = await self.db.get_classification_log(interaction.guild.id)
+
+        embed = discord.Embed(title='🔊 Классификация каналов', color=discord.Color.light_embed(), timestamp=discord.utils.utcnow())
+        embed.add_field(name=f'Учитываются ({len(counting)})', value='\n'.join(counting)[:1024] or 'Нет каналов.', inline=False)
+        embed.add_field(name='Не учитываются', value=str(len(classified) - len(counting)), inline=False)
+        embed.add_field(name='Последние изменения', value='\n'.join(
+            f'{discord.utils.format_dt(datetime.datetime.fromtimestamp(changed_at), "d")} <#{channel_id}>: '
+            f'{"учитывается" if flag else "не учитывается"} ({reason})'
+            for channel_id, flag, reason, changed_at in log
+        ) or 'Нет изменений.', inline=False)
+        embed.set_footer(text='Информация обновлена')
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    def join(self, member: discord.Member, channel: discord.VoiceChannel) -> None:
+        self.db.add_join_info(member, channel, self.db.classification.get(channel))
 
-    async def leave(self, member: discord.Member | AbstractUser, channel: discord.VoiceChannel | discord.StageChannel | AbstractChannel) -> None:
-        await self.db.add_leave_info(member, channel)
+    def leave(self, member: discord.Member, channel: discord.VoiceChannel | discord.StageChannel) -> None:
+        self.db.add_leave_info(member, channel)
 
     @commands.Cog.listener()
     async def on_voice_state_update(
@@ -190,46 +392,43 @@ class OnlineCog(commands.Cog):
         if before.channel == after.channel:
             if before.self_deaf != after.self_deaf:
                 if after.self_deaf:
-                    await self.leave(member, before.channel)
+                    self.leave(member, before.channel)
                 else:
-                    await self.join(member, after.channel)
+                    self.join(member, after.channel)
             return
         if after.self_deaf:
             return
 
         if before.channel is None:
-            await self.join(member, after.channel)
+            self.join(member, after.channel)
         elif after.channel is None:
-            await self.leave(member, before.channel)
+            self.leave(member, before.channel)
         else:
-            await self.leave(member, before.channel)
-            await self.join(member, after.channel)
-
-    async def update_member(self, current_info: CurrentInfo, member: discord.Member, channel: discord.VoiceChannel | discord.StageChannel) -> None:
-        if not (prev_channel := current_info.in_channel(member.id, channel.guild.id)):
-            if not member.voice.self_deaf:
-                await self.join(member, channel)
-        elif prev_channel != channel.id:
-            prev_channel_obj = AbstractChannel(_id=prev_channel[0], name=prev_channel[1])
-            await self.leave(member, prev_channel_obj)
-            if not member.voice.self_deaf:
-                await self.join(member, channel)
-
-    async def update_users(self, current_info: CurrentInfo, channel: discord.VoiceChannel | discord.StageChannel) -> None:
-        for member in channel.members:
-            await self.update_member(current_info, member, channel)
-        for user in current_info.get_channel_users(channel.id):
-            if user not in [member.id for member in channel.members]:
-                await self.leave(AbstractUser(user, channel.guild), channel)
+            self.leave(member, before.channel)
+            self.join(member, after.channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel) -> None:
+        if isinstance(channel, (discord.VoiceChannel, discord.StageChannel)):
+            self.db.classify_channel(channel, 'create')
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+        if isinstance(after, (discord.VoiceChannel, discord.StageChannel)):
+            self.db.classify_channel(after, 'update')
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        if isinstance(channel, (discord.VoiceChannel, discord.StageChannel)):
+            self.db.forget_channel(channel)
 
     @commands.Cog.listener()
     async def on_ready(self) -> None:
-        current_info = await self.db.get_current_info()
-        for channel in self.bot.get_all_channels():
-            if not isinstance(channel, (discord.VoiceChannel, discord.StageChannel)):
-                continue
-                
-            await self.update_users(current_info, channel)
+        for guild in self.bot.guilds:
+            for channel in (*guild.voice_channels, *guild.stage_channels):
+                self.db.classify_channel(channel, 'startup')
+        report = await self.db.reconcile(live_sessions(self.bot.guilds, self.db.classification.get))
+        logging.info(f'Voice reconciliation: {report}')
 
 async def setup(bot: Reverie):
     await bot.add_cog(OnlineCog(bot))
@@ -40,19 +40,30 @@ class PunishmentsBase(commands.Cog, name='punishments'):
 
         _, user = await self.bot.getch_any(interaction.guild, user)
 
-        actions = list(enumerate(
-            await db.actions.by_user(user.id, guild=interaction.guild.id if not global_alist else None, counting=True),
-            1))
+        guild = interaction.guild.id if not global_alist else None
+        actions = list(enumerate(await db.cache.get(
+            ('alist', guild, user.id), lambda: db.actions.by_user(user.id, guild=guild, counting=True), [('actions', guild, user.id)]
+        ), 1))
         if not actions:
             raise ValueError('Наказаний не найдено')
 
+        header = None
+        if guild:
+            summary = await db.actions.summaries.get(guild, user.id)
+            header = '・ ' + '\n・ '.join(
+                [f'{templates.action(action_type, short=True)}: `{count}`'
+                 for action_type, count in sorted(summary.counts.items(), key=lambda item: -item[1]) if count]
+                + [f'Активных наказаний: `{len(summary.active_now())}`']
+            )
+
         pagination = Pagination(
             bot=self.bot,
             interaction=interaction,
             owner=owner,
             data=actions,
             page_size=5,
-            embed_title=f'📕 Наказания пользователя {user}'
+            embed_title=f'📕 Наказания пользователя {user}',
+            header=header
         )
 
         await pagination.send_initial_message()
@@ -14,6 +14,7 @@ from info.tracking.stats import ModeratorStats
 from info.tracking.tracker import ModeratorTracker
 from info.tracking.formatter import StatsFormatter
 from database import db
+from database.indexes import registry
 
 
 class ActionInfo(NamedTuple):
@@ -93,7 +94,10 @@ class TrackingCog(commands.GroupCog, name='tracking'):
 
         date_obj = datetime.strptime(date, '%d.%m.%Y')
         tracker = ModeratorTracker(interaction.guild)
-        stats = await tracker.get_stats(moderator.id, date_obj)
+        stats = await db.cache.get(
+            ('tracking.my', interaction.guild.id, moderator.id, date), lambda: tracker.get_stats(moderator.id, date_obj),
+            [('moderator', interaction.guild.id, moderator.id), ('online', interaction.guild.id, moderator.id)]
+        )
 
         embed = discord.Embed(
             description=f'### 🛠️ Действия {moderator.mention}',
@@ -152,10 +156,8 @@ class TrackingCog(commands.GroupCog, name='tracking'):
                                for member in role.members)))
 
         tracker = ModeratorTracker(interaction.guild)
-        stats = {
-            mod: await tracker.get_stats(mod.id, start_date, end_date)
-            for mod in moderators
-        }
+        team = await tracker.get_team_stats([mod.id for mod in moderators], start_date, end_date)
+        stats = {mod: team[mod.id] for mod in moderators}
 
         embed = await self.create_stats_embed(
             title='📆 Статистика за неделю',
@@ -225,10 +227,8 @@ class TrackingCog(commands.GroupCog, name='tracking'):
                                for member in role.members)))
 
         tracker = ModeratorTracker(interaction.guild)
-        stats = {
-            mod: await tracker.get_stats(mod.id, date_obj)
-            for mod in moderators
-        }
+        team = await tracker.get_team_stats([mod.id for mod in moderators], date_obj)
+        stats = {mod: team[mod.id] for mod in moderators}
 
         embed = await self.create_stats_embed(
             title=f'📅 Статистика за {date}',
@@ -237,10 +237,43 @@ class TrackingCog(commands.GroupCog, name='tracking'):
 
         await interaction.response.send_message(embed=embed)
 
+    @app_commands.command(name='rebuild', description='Пересобрать дневную статистику модераторов')
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def rebuild(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        started = datetime.now()
+        days = await ModeratorTracker(interaction.guild).rebuild_daily_stats()
+        await interaction.followup.send(
+            f'### Дневная статистика пересобрана\nЗаписей: {days}\nВремя: {(datetime.now() - started).total_seconds():.2f} с.',
+            ephemeral=True
+        )
+
+    @app_commands.command(name='indexes', description='Использование индексов и запросы без индекса')
+    @security.restricted(security.PermissionLevel.SPEC)
+    async def indexes(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        usage, plans = await registry.usage(), await registry.explain()
+
+        lines = []
+        for collection in dict.fromkeys(item.collection for item in usage + plans):
+            lines.append(f'**{collection}**')
+            lines += [f'- `{item.name}`: {item.ops} обращений с {item.since:%d.%m.%Y}'
+                      for item in usage if item.collection == collection]
+            lines += [f'- ⚠️ полный просмотр: `{plan.query}`' for plan in plans if plan.collection == collection and plan.collscan]
+
+        collscans = sum(plan.collscan for plan in plans)
+        embed = discord.Embed(
+            title='🗂️ Индексы',
+            description='\n'.join(lines)[:4000],
+            color=discord.Color.red() if collscans else discord.Color.light_embed()
+        )
+        embed.set_footer(text=f'Проверено запросов: {len(plans)}, без индекса: {collscans}')
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
     @app_commands.command(name='check', description='Дополнительная проверка')
     @security.restricted(security.PermissionLevel.CUR)
     async def check(self, interaction: discord.Interaction):
-        similar_actions = await db.actions.similar(interaction.guild.id)
+        similar_actions = await db.actions.similar(interaction.guild.id, fields=('id', 'user', 'moderator'))
         if not similar_actions:
             return await interaction.response.send_message('Похожих действий не найдено', ephemeral=True)
         
@@ -5,3 +5,41 @@ _log_channels = {
     'punishments': ["выдача-наказаний", 'punishments'],
     'punishments_fast': ['запрос-на-выдачу', 'punishments']
 }
+
+# Хранилище голосового онлайна: 'sqlite' или 'mongo' (перенос данных — /online-admin transfer)
+online_backend = 'sqlite'
+# Голосовой онлайн: события пишутся пачками раз в online_flush_interval секунд или по online_batch_size штук
+online_batch_size = 500
+online_flush_interval = 2.0
+# Неудачная пачка повторяется с растущей паузой (до online_retry_max_delay секунд) и отбрасывается после online_apply_retries попыток
+online_apply_retries = 5
+online_retry_max_delay = 60.0
+# Переходы одного участника (заглушение, прыжки по каналам) за это окно схлопываются в итоговое состояние
+online_coalesce_window = 10.0
+# Отдельные соединения только для чтения (WAL), чтобы отчёты не задерживали запись сессий
+online_read_pool_size = 4
+# Открытые сессии начисляются в all_online каждые online_checkpoint_interval секунд
+online_checkpoint_interval = 300
+# Закреплённое сообщение с живым топом за день и неделю обновляется в каналах с такими названиями
+online_leaderboard_channels = ['онлайн-топ']
+online_leaderboard_interval = 60
+# Закрытые месяцы старше online_hot_months переносятся из SQLite в сжатые файлы архива
+online_archive_path = 'online_archive'
+online_hot_months = 3
+# Обслуживание SQLite (резервная копия, ANALYZE, incremental vacuum, проверка целостности) в часы низкой нагрузки
+online_maintenance_hour = 4
+online_maintenance_max_sessions = 30
+online_backup_path = 'online_backups'
+online_backup_keep = 7
+online_vacuum_pages = 1000
+
+# Транзакции MongoDB (только если она запущена как replica set): снятие прошлого наказания вместе с записью нового, пачки голосового онлайна
+mongo_transactions = True
+
+# Сводки наказаний пользователей: окно причин для подсказок о рецидиве (дни) и размер LRU-кэша сводок
+punishment_reasons_days = 30
+punishment_summary_cache_size = 4096
+
+# Кэш отчётов для частых команд (/online, /alist, /tracking my): время жизни в секундах и число записей
+read_cache_ttl = 15.0
+read_cache_size = 1024
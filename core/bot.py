@@ -22,6 +22,10 @@ class Reverie(commands.Bot):
         await db.on_load()
         await self.load_extensions()
 
+    async def close(self) -> None:
+        await db.on_close()
+        await super().close()
+
     async def load_extensions(self):
         for filename in os.listdir('./cogs'):
             if '__' not in filename:
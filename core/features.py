@@ -90,7 +90,7 @@ async def screenshot_messages(
 
 
 class Pagination(discord.ui.View):
-    def __init__(self, bot, interaction, owner, data, page_size=5, embed_title="Page"):
+    def __init__(self, bot, interaction, owner, data, page_size=5, embed_title="Page", header=None):
         super().__init__()
         self.bot = bot
         self.interaction = interaction
@@ -100,6 +100,7 @@ class Pagination(discord.ui.View):
         self.pages = self._paginate_data(data)
         self.current_page = 0
         self.embed_title = embed_title
+        self.header = header
 
         self._update_buttons()
 
@@ -116,6 +117,8 @@ class Pagination(discord.ui.View):
         """Create an embed for the given page number."""
         page_data = self.pages[page_number]
         description = "\n".join([item[1].to_text(item[0]) for index, item in enumerate(page_data)])
+        if self.header:
+            description = f'{self.header}\n\n{description}'
         embed = discord.Embed(title=self.embed_title,
                               description=description, color=discord.Color.dark_red())
         embed.set_footer(text=f'Страница {page_number + 1}/{len(self.pages)}')
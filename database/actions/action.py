@@ -33,7 +33,7 @@ def gmd_indicator() -> discord.ui.View:
     return view
 
 
-@dataclass
+@dataclass(slots=True)
 class Act:
     id: int
     at: datetime.datetime
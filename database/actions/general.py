@@ -1,10 +1,22 @@
+import asyncio
+import contextlib
 import datetime
+import logging
 import typing
 
 import discord
-from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from motor.motor_asyncio import AsyncIOMotorClientSession as MotorSession, AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel, ReturnDocument, UpdateOne
 
+import config
 from database.actions.action import Act, action
+from database.actions import unit_of_work
+from database.actions.summary import PunishmentSummaries
+from database.cache import ReadModelCache
+from database.counters import Counters
+from database.indexes import registry
+from database.moderator_stats import ModeratorDailyStats
+from database.records import Record, reader
 from info.punishments import hints_to_definitions
 
 if typing.TYPE_CHECKING:
@@ -12,12 +24,61 @@ if typing.TYPE_CHECKING:
 
 
 class Actions:
-    def __init__(self, collection: MotorCollection):
+    def __init__(self, collection: MotorCollection, stats: ModeratorDailyStats, cache: ReadModelCache, counters: Counters,
+                 summaries: PunishmentSummaries):
         self._collection = collection
-        self.reasons_cache: dict[(int, int), list[str]] = {}
+        self.stats = stats
+        self.summaries = summaries
+        self.cache = cache
+        self.counters = counters
+        self.counters.register('actions', self._collection)
+        registry.declare(self._collection, [
+            IndexModel([('user', 1), ('guild', 1), ('type', 1), ('counting', 1), ('id', -1)]),
+            IndexModel([('moderator', 1), ('guild', 1), ('at', 1)]),
+            IndexModel([('guild', 1), ('counting', 1), ('at', 1)]),
+        ], probes=[
+            {'id': 0}, {'user': 0}, {'user': 0, 'guild': 0, 'counting': True},
+            {'user': 0, 'guild': 0, 'type': 'warn', 'counting': True},
+            {'moderator': 0, 'guild': 0, 'at': {'$gte': datetime.datetime(2024, 1, 1)}},
+            {'guild': 0, 'counting': True, 'at': {'$gte': datetime.datetime(2024, 1, 1)}},
+        ])
+        self.transactions = False
 
-    async def get(self, act_id: int) -> Act:
-        return Act(**await self._collection.find_one({'id': act_id}))
+    async def init(self) -> None:
+        await self.summaries.init(self._collection)
+        if not config.mongo_transactions:
+            return
+        hello = await self._collection.database.client.admin.command('hello')
+        self.transactions = 'setName' in hello
+        if not self.transactions:
+            logging.info('MongoDB is not a replica set, actions are recorded without transactions')
+
+    @contextlib.asynccontextmanager
+    async def unit_of_work(self) -> typing.AsyncIterator[unit_of_work.UnitOfWork]:
+        # Повторные get() в пределах одного взаимодействия отдают тот же Act, отложенные изменения пишутся одним bulk_write
+        if (uow := unit_of_work.current()) is not None:
+            yield uow
+            return
+        uow, token = unit_of_work.begin()
+        try:
+            yield uow
+        finally:
+            unit_of_work.end(uow, token)
+        if uow.updates:
+            await self._collection.bulk_write(
+                [UpdateOne({'id': act_id}, {'$set': fields}) for act_id, fields in uow.updates.items()], ordered=False
+            )
+            for act in (uow.acts[act_id] for act_id in uow.updates):
+                self.cache.invalidate(('actions', act.guild, act.user), ('actions', None, act.user))
+
+    async def get(self, act_id: int) -> Act | None:
+        uow = unit_of_work.current()
+        if uow is not None and act_id in uow.acts:
+            return uow.acts[act_id]
+        doc = await self._collection.find_one({'id': act_id})
+        if doc is None:
+            return None
+        return uow.track(Act(**doc)) if uow is not None else Act(**doc)
 
     async def by_user(self, user: int, *, guild: typing.Optional[int] = None, counting: bool = False, after: datetime.datetime = None) -> list[Act]:
         query = {'user': user}
@@ -45,6 +106,28 @@ class Actions:
             query['counting'] = True
         return [Act(**doc) async for doc in self._collection.find(query)]
 
+    async def guilds(self) -> list[int]:
+        return await self._collection.distinct('guild')
+
+    async def moderator_counts(self, guild: int, moderators: list[int] = None, date_from: datetime.datetime = None,
+                               date_to: datetime.datetime = None) -> list[tuple[int, str, str, int]]:
+        query = {'guild': guild, 'counting': True}
+        if moderators is not None:
+            query['moderator'] = {'$in': moderators}
+        if date_from:
+            date_from = date_from.replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+            if date_to:
+                date_to = date_to.replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+            query['at'] = {'$gte': date_from, '$lt': date_to or date_from + datetime.timedelta(days=1)}
+        pipeline = [
+            {'$match': query},
+            {'$group': {'_id': {'moderator': '$moderator', 'type': '$type',
+                                'date': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$at', 'timezone': '+03:00'}}},
+                        'count': {'$sum': 1}}},
+        ]
+        return [(doc['_id']['moderator'], doc['_id']['date'], doc['_id']['type'], doc['count'])
+                async for doc in self._collection.aggregate(pipeline)]
+
     async def record(
             self, user: int, guild: int,
             moderator: int, action_type: action, *,
@@ -57,17 +140,10 @@ class Actions:
                 '### Вы ввели некорректную причину.\nВозможно, вы нажали не туда?\n-# Не нажимайте на названия категорий\n-# Попробуйте **ввести название категории** вручную и тогда **выбрать из предложенных**.')
         if reason:
             reason = hints_to_definitions(reason)
-            if (guild, user) in self.reasons_cache:
-                self.reasons_cache[(guild, user)].append(reason)
-
-        if 'role' not in action_type and 'remove' in action_type:
-            last_act = await self.last_act(user, guild, str(action_type).replace('remove', 'give'))
-            if last_act:
-                await self.deactivate(last_act.id, moderator)
 
-        act_id = (await self._collection.count_documents({})) + 1
+        previous_type = str(action_type).replace('remove', 'give') if 'role' not in action_type and 'remove' in action_type else None
         act = Act(
-            id=act_id,
+            id=None,
             at=datetime.datetime.now(datetime.UTC),
             user=user,
             guild=guild,
@@ -79,10 +155,68 @@ class Actions:
             reason=reason,
             prove_link=prove_link
         )
-        await self._collection.insert_one(act.as_dict)
+        if self.transactions:
+            async with await self._collection.database.client.start_session() as session:
+                previous = await session.with_transaction(lambda s: self._write(act, previous_type, s))
+            self.summaries.forget(guild, user)
+        else:
+            previous = await self._write(act, previous_type)
+
+        self.cache.invalidate(('actions', guild, user), ('actions', None, user), ('moderator', guild, moderator))
+        if previous:
+            self._deactivated(previous, moderator)
+        if (uow := unit_of_work.current()) is not None:
+            uow.track(act)
         return act
 
+    async def _write(self, act: Act, previous_type: action | None, session: MotorSession = None) -> Act | None:
+        # Номер действия и снятие прошлого наказания не зависят друг от друга и идут одним раундом
+        if previous_type:
+            act.id, previous = await asyncio.gather(self.counters.next('actions'), self._deactivate(
+                {'user': act.user, 'guild': act.guild, 'type': previous_type, 'counting': True}, act.moderator, session),
+                return_exceptions=True)
+            if isinstance(previous, Exception):
+                raise previous
+            if isinstance(act.id, Exception):
+                # Снятие уже записано вне транзакции, его счётчики должны ему соответствовать
+                if not session and previous and previous.counting:
+                    await asyncio.gather(*self._uncount(previous))
+                raise act.id
+        else:
+            act.id, previous = await self.counters.next('actions'), None
+        # Вторым раундом вставка и счётчики обеих записей; внутри сессии MongoDB требует запросы по очереди
+        if session:
+            await self._collection.insert_one(act.as_dict, session=session)
+            if previous and previous.counting:
+                await self.stats.add_punishment(previous.guild, previous.moderator, previous.at, previous.type, -1, session=session)
+                await self.summaries.remove(previous, session)
+            if act.counting:
+                await self.stats.add_punishment(act.guild, act.moderator, act.at, act.type, session=session)
+                await self.summaries.add(act, session)
+            return previous
+        counters = self._uncount(previous) if previous and previous.counting else []
+        added = [self.stats.add_punishment(act.guild, act.moderator, act.at, act.type), self.summaries.add(act)] if act.counting else []
+        inserted, *results = await asyncio.gather(self._collection.insert_one(act.as_dict), *counters, *added,
+                                                  return_exceptions=True)
+        if isinstance(inserted, Exception):
+            # Без записи действия его прибавки к счётчикам откатываются, снятие прошлого уже записано и остаётся
+            rollback = []
+            if act.counting and not isinstance(results[-2], Exception):
+                rollback.append(self.stats.add_punishment(act.guild, act.moderator, act.at, act.type, -1))
+            if act.counting and not isinstance(results[-1], Exception):
+                rollback.append(self.summaries.remove(act))
+            for result in await asyncio.gather(*rollback, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logging.error(f'Failed to roll back counters of unrecorded action {act.id}: {result!r}')
+            raise inserted
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return previous
+
     async def set_prove_link(self, act_id: int, link: str) -> None:
+        if (uow := unit_of_work.current()) is not None and act_id in uow.acts:
+            return uow.update(uow.acts[act_id], prove_link=link)
         await self._collection.update_one({'id': act_id}, {'$set': {'prove_link': link}})
 
     async def last_act(self, user: int, guild: int, action_type: action) -> Act | None:
@@ -91,14 +225,32 @@ class Actions:
             return None
         return Act(**act)
 
+    async def _deactivate(self, query: dict, reviewer: int, session: MotorSession = None) -> Act | None:
+        # Документ до изменения: засчитанное снятие откатывается в дневной статистике ровно один раз
+        doc = await self._collection.find_one_and_update(
+            query, {'$set': {'reviewer': reviewer, 'counting': False}},
+            sort=[('id', -1)], return_document=ReturnDocument.BEFORE, session=session
+        )
+        return Act(**doc) if doc is not None else None
+
+    def _uncount(self, act: Act) -> list[typing.Awaitable]:
+        return [self.stats.add_punishment(act.guild, act.moderator, act.at, act.type, -1), self.summaries.remove(act)]
+
+    def _deactivated(self, act: Act, reviewer: int) -> None:
+        if (uow := unit_of_work.current()) is not None and act.id in uow.acts:
+            uow.acts[act.id].counting, uow.acts[act.id].reviewer = False, reviewer
+        self.cache.invalidate(('actions', act.guild, act.user), ('actions', None, act.user), ('moderator', act.guild, act.moderator))
+
     async def deactivate(self, act_id: int, reviewer: int) -> None:
-        act = await self.get(act_id)
-        if (act.guild, act.user) in self.reasons_cache:
-            self.reasons_cache[(act.guild, act.user)].remove(act.reason)
-        await self._collection.update_one({'id': act_id}, {'$set': {'reviewer': reviewer, 'counting': False}})
+        act = await self._deactivate({'id': act_id}, reviewer)
+        if act:
+            if act.counting:
+                await asyncio.gather(*self._uncount(act))
+            self._deactivated(act, reviewer)
 
     async def approve(self, act_id: int, reviewer: int, client: 'Reverie' = None,
                       interaction: discord.Interaction = None) -> None:
+        uow = unit_of_work.current()
         act = await self.get(act_id)
         if 'ban' in act.type and 'give' in act.type:
             bans = client.get_cog('ban')
@@ -110,9 +262,12 @@ class Actions:
                 await warns.on_approve(interaction, act_id, user)
             elif 'remove' in act.type:
                 await warns.on_remove_approve(act_id)
-        await self._collection.update_one({'id': act_id}, {'$set': {'reviewer': reviewer}})
+        if uow is not None:
+            uow.update(act, reviewer=reviewer)
+        else:
+            await self._collection.update_one({'id': act_id}, {'$set': {'reviewer': reviewer}})
 
-    async def similar(self, guild_id: int) -> list[Act]:
+    async def similar(self, guild_id: int, fields: typing.Iterable[str] = None) -> list[Act] | list[Record]:
         pipeline = [
             {'$match': {'guild': guild_id}},
             {'$group': {
@@ -123,12 +278,11 @@ class Actions:
         ]
         results = [doc async for doc in self._collection.aggregate(pipeline)]
         query = {'$or': [{'user': doc['_id']['user'], 'moderator': doc['_id']['moderator']} for doc in results]}
-        return [Act(**doc) async for doc in self._collection.find(query)] if results else []
+        if not results:
+            return []
+        projection, make = reader(Act, fields)
+        return [make(doc) async for doc in self._collection.find(query, projection)]
 
     async def reasons_history(self, user_id: int, guild_id: int) -> list[str]:
-        if (cache := self.reasons_cache.get((guild_id, user_id))) is not None:
-            return cache
-
-        all_acts = await self.by_user(user_id, guild=guild_id, counting=True, after=datetime.datetime.now() - datetime.timedelta(days=30))
-        self.reasons_cache[(guild_id, user_id)] = [act.reason for act in all_acts if act.reason]
-        return self.reasons_cache[(guild_id, user_id)]
\ No newline at end of file
+        summary = await self.summaries.get(guild_id, user_id)
+        return summary.recent_reasons(config.punishment_reasons_days)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import collections
+import datetime
+import logging
+from dataclasses import dataclass, field
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClientSession as MotorSession, AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel, ReturnDocument
+
+from database.actions.action import Act
+from database.indexes import registry
+
+_reasons_limit = 50
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+@dataclass
+class PunishmentSummary:
+    guild: int
+    user: int
+    counts: dict[str, int] = field(default_factory=dict)
+    reasons: list[dict] = field(default_factory=list)
+    active: list[dict] = field(default_factory=list)
+    version: int = 0
+    _id: ObjectId = None
+
+    def recent_reasons(self, days: int) -> list[str]:
+        since = _utcnow() - datetime.timedelta(days=days)
+        return [item['reason'] for item in self.reasons if item['at'].replace(tzinfo=None) >= since]
+
+    def active_now(self) -> list[dict]:
+        now = _utcnow()
+        return [item for item in self.active if item['until'] is None or item['until'].replace(tzinfo=None) > now]
+
+
+class PunishmentSummaries:
+    def __init__(self, collection: MotorCollection, cache_size: int):
+        self._collection = collection
+        self.cache_size = cache_size
+        self._cache: collections.OrderedDict[tuple[int, int], PunishmentSummary] = collections.OrderedDict()
+        registry.declare(self._collection, [IndexModel([('guild', 1), ('user', 1)], unique=True)],
+                         probes=[{'guild': 0, 'user': 0}])
+
+    async def init(self, actions: MotorCollection) -> None:
+        if await self._collection.estimated_document_count():
+            return
+        count = await self.rebuild(actions)
+        logging.info(f'Built {count} punishment summaries from actions')
+
+    async def rebuild(self, actions: MotorCollection) -> int:
+        # Разовая сборка из всех засчитанных действий, дальше сводки ведутся инкрементально в Actions
+        pipeline = [
+            {'$match': {'counting': True}},
+            {'$sort': {'id': 1}},
+            {'$group': {
+                '_id': {'guild': '$guild', 'user': '$user'},
+                'types': {'$push': '$type'},
+                'reasons': {'$push': {'$cond': [{'$ifNull': ['$reason', False]},
+                                                {'act': '$id', 'at': '$at', 'reason': '$reason'}, None]}},
+                'active': {'$push': {'$cond': [
+                    {'$regexMatch': {'input': '$type', 'regex': '_give$'}},
+                    {'act': '$id', 'type': '$type',
+                     'until': {'$cond': [{'$ifNull': ['$duration', False]},
+                                         {'$add': ['$at', {'$multiply': ['$duration', 1000]}]}, None]}},
+                    None
+                ]}},
+            }},
+            {'$project': {
+                '_id': 0, 'guild': '$_id.guild', 'user': '$_id.user', 'version': {'$literal': 1},
+                'counts': {'$arrayToObject': {'$map': {
+                    'input': {'$setUnion': ['$types']}, 'as': 'type',
+                    'in': {'k': '$$type', 'v': {'$size': {'$filter': {'input': '$types', 'cond': {'$eq': ['$$this', '$$type']}}}}}
+                }}},
+                'reasons': {'$slice': [{'$filter': {'input': '$reasons', 'cond': {'$ne': ['$$this', None]}}}, -_reasons_limit]},
+                'active': {'$filter': {'input': '$active', 'cond': {'$ne': ['$$this', None]}}},
+            }},
+            {'$merge': {'into': self._collection.name, 'on': ['guild', 'user'], 'whenMatched': 'replace'}},
+        ]
+        await actions.aggregate(pipeline).to_list(None)
+        self._cache.clear()
+        return await self._collection.count_documents({})
+
+    def _remember(self, summary: PunishmentSummary) -> None:
+        key = (summary.guild, summary.user)
+        cached = self._cache.get(key)
+        # Ответы параллельных записей могут прийти не по порядку, версия не даёт откатить кэш
+        if cached is None or cached.version < summary.version:
+            self._cache[key] = summary
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def forget(self, guild: int, user: int) -> None:
+        self._cache.pop((guild, user), None)
+
+    async def get(self, guild: int, user: int) -> PunishmentSummary:
+        if (cached := self._cache.get((guild, user))) is not None:
+            self._cache.move_to_end((guild, user))
+            return cached
+        doc = await self._collection.find_one({'guild': guild, 'user': user})
+        summary = PunishmentSummary(**doc) if doc else PunishmentSummary(guild=guild, user=user)
+        self._remember(summary)
+        return summary
+
+    async def _update(self, act: Act, update: dict, session: MotorSession = None) -> None:
+        update.setdefault('$inc', {})['version'] = 1
+        doc = await self._collection.find_one_and_update(
+            {'guild': act.guild, 'user': act.user}, update,
+            upsert=True, return_document=ReturnDocument.AFTER, session=session
+        )
+        # Внутри транзакции документ ещё не зафиксирован, кэш сбрасывается после коммита
+        if session is None:
+            self._remember(PunishmentSummary(**doc))
+
+    async def add(self, act: Act, session: MotorSession = None) -> None:
+        update = {'$inc': {f'counts.{act.type}': 1}, '$push': {}}
+        if act.reason:
+            update['$push']['reasons'] = {'$each': [{'act': act.id, 'at': act.at, 'reason': act.reason}],
+                                          '$slice': -_reasons_limit}
+        if act.type.endswith('_give'):
+            until = act.at + datetime.timedelta(seconds=act.duration) if act.duration else None
+            update['$push']['active'] = {'act': act.id, 'type': act.type, 'until': until}
+        if not update['$push']:
+            del update['$push']
+        await self._update(act, update, session)
+
+    async def remove(self, act: Act, session: MotorSession = None) -> None:
+        await self._update(act, {
+            '$inc': {f'counts.{act.type}': -1},
+            '$pull': {'reasons': {'act': act.id}, 'active': {'act': act.id}}
+        }, session)
@@ -0,0 +1,36 @@
+import contextvars
+
+from database.actions.action import Act
+
+_current: contextvars.ContextVar['UnitOfWork | None'] = contextvars.ContextVar('unit_of_work', default=None)
+
+
+class UnitOfWork:
+    def __init__(self):
+        self.acts: dict[int, Act] = {}
+        self.updates: dict[int, dict] = {}
+        self.closed = False
+
+    def track(self, act: Act) -> Act:
+        return self.acts.setdefault(act.id, act)
+
+    def update(self, act: Act, **fields) -> None:
+        for key, value in fields.items():
+            setattr(act, key, value)
+        self.updates.setdefault(act.id, {}).update(fields)
+
+
+def current() -> UnitOfWork | None:
+    # Задачи, созданные внутри обработчика, наследуют контекст и могут пережить его, закрытая единица работы для них не видна
+    uow = _current.get()
+    return uow if uow is not None and not uow.closed else None
+
+
+def begin() -> tuple[UnitOfWork, contextvars.Token]:
+    uow = UnitOfWork()
+    return uow, _current.set(uow)
+
+
+def end(uow: UnitOfWork, token: contextvars.Token) -> None:
+    uow.closed = True
+    _current.reset(token)
@@ -0,0 +1,108 @@
+import asyncio
+import collections
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Iterable, TypeVar
+
+T = TypeVar('T')
+
+
+@dataclass
+class CacheStats:
+    size: int
+    hits: int
+    misses: int
+    coalesced: int
+    invalidations: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / requests if requests else 0.0
+
+
+class ReadModelCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[Hashable, tuple[float, Any, frozenset]] = collections.OrderedDict()
+        self._by_tag: dict[Hashable, set[Hashable]] = {}
+        self._inflight: dict[Hashable, tuple[asyncio.Task, frozenset]] = {}
+        # Версии тегов нужны только идущим загрузкам и удаляются вместе с последней из них
+        self._versions: dict[Hashable, int] = {}
+        self._loading: collections.Counter[Hashable] = collections.Counter()
+        self._hits = self._misses = self._coalesced = self._invalidations = self._evictions = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[T]], tags: Iterable[Hashable] = ()) -> T:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+        if entry is not None:
+            self._drop(key)
+
+        if key in self._inflight:
+            self._coalesced += 1
+            return await asyncio.shield(self._inflight[key][0])
+
+        # Одинаковые запросы во время загрузки ждут одну задачу, запись по тегу отменяет сохранение результата
+        self._misses += 1
+        tags = frozenset(tags)
+        versions = {tag: self._versions.get(tag, 0) for tag in tags}
+        self._loading.update(tags)
+        task = asyncio.ensure_future(loader())
+        self._inflight[key] = (task, tags)
+        task.add_done_callback(lambda done: self._loaded(key, tags, versions, done))
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: Hashable, tags: frozenset, versions: dict[Hashable, int], task: asyncio.Task) -> None:
+        if self._inflight.get(key, (None,))[0] is task:
+            del self._inflight[key]
+        stale = any(self._versions.get(tag, 0) != version for tag, version in versions.items())
+        self._loading.subtract(tags)
+        for tag in tags:
+            if self._loading[tag] <= 0:
+                del self._loading[tag]
+                self._versions.pop(tag, None)
+        if stale or task.cancelled() or task.exception() is not None:
+            return
+        self._store(key, task.result(), tags)
+
+    def _store(self, key: Hashable, value: Any, tags: frozenset) -> None:
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, *tags: Hashable) -> None:
+        for tag in tags:
+            if tag in self._loading:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            for key in list(self._by_tag.get(tag, ())):
+                self._drop(key)
+                self._invalidations += 1
+        for key, (_, key_tags) in list(self._inflight.items()):
+            if key_tags.intersection(tags):
+                del self._inflight[key]
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._entries), hits=self._hits, misses=self._misses, coalesced=self._coalesced,
+            invalidations=self._invalidations, evictions=self._evictions
+        )
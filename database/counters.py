@@ -0,0 +1,42 @@
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+
+class Counters:
+    def __init__(self, collection: MotorCollection):
+        self._collection = collection
+        self._sequences: dict[str, MotorCollection] = {}
+
+    def register(self, name: str, collection: MotorCollection) -> None:
+        self._sequences[name] = collection
+
+    async def init(self) -> None:
+        for name, collection in self._sequences.items():
+            try:
+                await collection.create_index('id', unique=True)
+            except OperationFailure as error:
+                logging.error(f'Cannot create unique index on {collection.full_name}.id, duplicate ids present: {error}')
+                await collection.create_index('id')
+            await self.seed(name, collection)
+
+    async def seed(self, name: str, collection: MotorCollection) -> int:
+        # $max не даёт откатить счётчик назад, поэтому засев можно повторять при каждом запуске
+        last = await collection.find_one({'id': {'$ne': None}}, {'id': 1}, sort=[('id', -1)])
+        result = await self._collection.find_one_and_update(
+            {'_id': name}, {'$max': {'value': last['id'] if last else 0}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return result['value']
+
+    async def reserve(self, name: str, count: int = 1) -> range:
+        result = await self._collection.find_one_and_update(
+            {'_id': name}, {'$inc': {'value': count}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return range(result['value'] - count + 1, result['value'] + 1)
+
+    async def next(self, name: str) -> int:
+        return (await self.reserve(name))[0]
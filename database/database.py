@@ -3,8 +3,14 @@ import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 
+import config
 from database.actions.general import Actions
+from database.actions.summary import PunishmentSummaries
+from database.cache import ReadModelCache
+from database.counters import Counters
 from database.greeting.general import Greeting
+from database.indexes import registry
+from database.moderator_stats import ModeratorDailyStats
 from database.notifications import Notifications
 from database.online.general import OnlineDatabase
 from database.punishments.general import Punishments
@@ -17,13 +23,25 @@ class Database:
         
         self._client = AsyncIOMotorClient(os.getenv('MONGO_URI'))
         self._db = self._client['Reverie']
-        self.actions = Actions(self._db['actions'])
+        self.cache = ReadModelCache(config.read_cache_size, config.read_cache_ttl)
+        self.counters = Counters(self._db['counters'])
+        self.moderator_stats = ModeratorDailyStats(self._db['moderator_daily_stats'])
+        self.actions = Actions(
+            self._db['actions'], self.moderator_stats, self.cache, self.counters,
+            PunishmentSummaries(self._db['punishment_summary'], config.punishment_summary_cache_size)
+        )
         self.punishments = Punishments(self._client, self.actions)
-        self.roles = Roles(self._client, self.actions)
-        self.online = OnlineDatabase('online.sqlite')
-        self.notifications = Notifications(self._db['notifications'])
+        self.roles = Roles(self._client, self.actions, self.moderator_stats, self.cache, self.counters)
+        self.online = OnlineDatabase('online.sqlite', self._client, cache=self.cache)
+        self.notifications = Notifications(self._db['notifications'], self.counters)
         self.greeting = Greeting(self._client)
 
     async def on_load(self):
+        await self.counters.init()
+        await registry.init()
+        await self.actions.init()
+        await self.moderator_stats.init(self.actions, self.roles)
         await self.online.init_db()
-    
\ No newline at end of file
+
+    async def on_close(self):
+        await self.online.close_db()
@@ -1,6 +1,9 @@
 from typing import Literal
 
 from motor.motor_asyncio import AsyncIOMotorClient as MotorClient
+from pymongo import IndexModel
+
+from database.indexes import registry
 
 from database.greeting.settings import GreetingSettings
 
@@ -12,6 +15,7 @@ class Greeting:
         self._client = client
         self._db = self._client['Reverie']
         self._col = self._db['greeting']
+        registry.declare(self._col, [IndexModel('guild')], probes=[{'guild': 0}])
 
     async def get_settings(self, guild: int) -> GreetingSettings | None:
         result = await self._col.find_one({'guild': guild})
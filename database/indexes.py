@@ -0,0 +1,71 @@
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Iterable
+
+from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+
+@dataclass
+class IndexUsage:
+    collection: str
+    name: str
+    ops: int
+    since: datetime.datetime
+
+
+@dataclass
+class ProbePlan:
+    collection: str
+    query: dict
+    stages: list[str]
+
+    @property
+    def collscan(self) -> bool:
+        return 'COLLSCAN' in self.stages
+
+
+def _stages(plan: dict) -> list[str]:
+    plan = plan.get('queryPlan', plan)
+    stages = [f"{plan['stage']} {plan['indexName']}" if 'indexName' in plan else plan['stage']]
+    for child in [plan['inputStage']] if 'inputStage' in plan else plan.get('inputStages', []):
+        stages += _stages(child)
+    return stages
+
+
+class IndexRegistry:
+    def __init__(self):
+        self._collections: dict[str, tuple[MotorCollection, list[IndexModel], list[dict]]] = {}
+
+    def declare(self, collection: MotorCollection, indexes: Iterable[IndexModel], probes: Iterable[dict] = ()) -> None:
+        # probes - типичные фильтры запросов коллекции, по ним explain проверяет, что индекс действительно выбирается
+        self._collections[collection.full_name] = (collection, list(indexes), list(probes))
+
+    async def init(self) -> None:
+        for name, (collection, indexes, _) in self._collections.items():
+            if not indexes:
+                continue
+            try:
+                await collection.create_indexes(indexes)
+            except OperationFailure as error:
+                logging.error(f'Cannot create indexes for {name}: {error}')
+
+    async def usage(self) -> list[IndexUsage]:
+        result = []
+        for name, (collection, _, _) in self._collections.items():
+            async for doc in collection.aggregate([{'$indexStats': {}}]):
+                result.append(IndexUsage(name, doc['name'], doc['accesses']['ops'], doc['accesses']['since']))
+        return result
+
+    async def explain(self) -> list[ProbePlan]:
+        result = []
+        for name, (collection, _, probes) in self._collections.items():
+            for query in probes:
+                plan = await collection.find(query).explain()
+                result.append(ProbePlan(name, query, _stages(plan['queryPlanner']['winningPlan'])))
+        return result
+
+
+registry = IndexRegistry()
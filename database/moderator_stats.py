@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import logging
+import typing
+from dataclasses import dataclass, field
+from typing import Literal
+
+from motor.motor_asyncio import AsyncIOMotorClientSession as MotorSession, AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+
+from database.indexes import registry
+
+if typing.TYPE_CHECKING:
+    from database.actions.general import Actions
+    from database.roles.general import Roles
+
+type RoleKey = Literal['approved', 'rejected', 'removed']
+
+
+def local_date(at: datetime.datetime) -> str:
+    return (at + datetime.timedelta(hours=3)).strftime('%Y-%m-%d')
+
+
+@dataclass
+class DailyStats:
+    guild: int
+    moderator: int
+    date: str
+    punishments: dict[str, int] = field(default_factory=dict)
+    roles: dict[str, int] = field(default_factory=dict)
+    _id: str = None
+
+
+class ModeratorDailyStats:
+    def __init__(self, collection: MotorCollection):
+        self._collection = collection
+        # Пока коллекция не собрана, отчёты считаются агрегацией по исходным коллекциям
+        self.ready = False
+        registry.declare(self._collection, [
+            IndexModel([('guild', 1), ('moderator', 1), ('date', 1)], unique=True),
+            IndexModel([('guild', 1), ('date', 1)]),
+        ], probes=[{'guild': 0, 'moderator': {'$in': [0]}, 'date': {'$gte': '2024-01-01', '$lte': '2024-01-31'}}])
+
+    async def _inc(self, guild: int, moderator: int, at: datetime.datetime, key: str, delta: int,
+                   session: MotorSession = None) -> None:
+        await self._collection.update_one(
+            {'guild': guild, 'moderator': moderator, 'date': local_date(at)},
+            {'$inc': {key: delta}}, upsert=True, session=session
+        )
+
+    async def add_punishment(self, guild: int, moderator: int, at: datetime.datetime, action_type: str, delta: int = 1,
+                             session: MotorSession = None) -> None:
+        await self._inc(guild, moderator, at, f'punishments.{action_type}', delta, session)
+
+    async def add_role(self, guild: int, moderator: int, at: datetime.datetime, key: RoleKey, delta: int = 1) -> None:
+        await self._inc(guild, moderator, at, f'roles.{key}', delta)
+
+    async def period(self, guild: int, moderators: list[int], date_from: datetime.datetime,
+                     date_to: datetime.datetime) -> list[DailyStats]:
+        query = {'guild': guild, 'moderator': {'$in': moderators},
+                 'date': {'$gte': date_from.strftime('%Y-%m-%d'), '$lte': date_to.strftime('%Y-%m-%d')}}
+        return [DailyStats(**doc) async for doc in self._collection.find(query)]
+
+    async def init(self, actions: 'Actions', roles: 'Roles') -> None:
+        if not await self._collection.estimated_document_count():
+            guilds = set(await actions.guilds()) | set(await roles.guilds())
+            days = sum([await self.rebuild(guild, actions, roles) for guild in guilds])
+            logging.info(f'Built {days} moderator daily stats for {len(guilds)} guilds')
+        self.ready = True
+
+    @staticmethod
+    def assemble(guild: int, punishments: list[tuple[int, str, str, int]], requests: list[tuple[int, str, bool, int]],
+                 removes: list[tuple[int, str, int]]) -> dict[tuple[int, str], DailyStats]:
+        days: dict[tuple[int, str], DailyStats] = {}
+
+        def day(moderator: int, date: str) -> DailyStats:
+            return days.setdefault((moderator, date), DailyStats(guild=guild, moderator=moderator, date=date))
+
+        for moderator, date, action_type, count in punishments:
+            day(moderator, date).punishments[action_type] = count
+        for moderator, date, approved, count in requests:
+            day(moderator, date).roles['approved' if approved else 'rejected'] = count
+        for moderator, date, count in removes:
+            day(moderator, date).roles['removed'] = count
+        return days
+
+    async def rebuild(self, guild: int, actions: 'Actions', roles: 'Roles') -> int:
+        # Документы, созданные счётчиками во время пересборки, не попадают в этот снимок и не удаляются
+        existing = {(doc['moderator'], doc['date']): doc['_id']
+                    async for doc in self._collection.find({'guild': guild}, {'moderator': 1, 'date': 1})}
+        punishments, (requests, removes) = await asyncio.gather(actions.moderator_counts(guild), roles.moderator_counts(guild))
+
+        days = self.assemble(guild, punishments, requests, removes)
+
+        # Сборка идёт во временную коллекцию и вливается одной операцией: живые счётчики не обнуляются на время пересборки
+        if days:
+            staging = self._collection.database[f'{self._collection.name}_rebuild_{guild}']
+            await staging.drop()
+            await staging.insert_many([{'guild': stats.guild, 'moderator': stats.moderator, 'date': stats.date,
+                                        'punishments': stats.punishments, 'roles': stats.roles}
+                                       for stats in days.values()])
+            await staging.aggregate([
+                {'$project': {'_id': 0}},
+                {'$merge': {'into': self._collection.name, 'on': ['guild', 'moderator', 'date'],
+                            'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+            ]).to_list(None)
+            await staging.drop()
+        stale = [_id for key, _id in existing.items() if key not in days]
+        if stale:
+            await self._collection.delete_many({'_id': {'$in': stale}})
+        return len(days)
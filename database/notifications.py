@@ -7,12 +7,16 @@ from dataclasses import dataclass, asdict
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+
+from database.counters import Counters
+from database.indexes import registry
 
 if typing.TYPE_CHECKING:
     from database.actions.general import Actions
     from database.actions.action import Act
 
-@dataclass
+@dataclass(slots=True)
 class Notification:
     user: int
     guild: int
@@ -44,8 +48,11 @@ class Notification:
         await callback(self)
 
 class Notifications:
-    def __init__(self, collection: MotorCollection):
+    def __init__(self, collection: MotorCollection, counters: Counters):
         self._collection = collection
+        self.counters = counters
+        self.counters.register('notifications', self._collection)
+        registry.declare(self._collection, [IndexModel('expired')], probes=[{'expired': False}, {'id': 0, 'notified': False}])
         self._expiration_callback: Optional[Callable[[Notification], Awaitable[None]]] = None
         self.current: list[Notification] = []
 
@@ -79,7 +86,7 @@ class Notifications:
             self, *,
             user: int, guild: int, moderator: int, notification_type: str, duration: float, message_id: int
     ) -> 'Act':
-        notification_id = (await self._collection.count_documents({})) + 1
+        notification_id = await self.counters.next('notifications')
 
         notification = Notification(
             user=user, guild=guild, moderator=moderator, type=notification_type,
@@ -0,0 +1,120 @@
+import datetime
+from dataclasses import dataclass
+
+import discord
+import numpy as np
+
+from core import templates
+
+
+@dataclass
+class SessionFrame:
+    user_id: np.ndarray
+    channel_id: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple[int, int, int, int]], range_start: int, range_end: int) -> 'SessionFrame':
+        data = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        start = np.clip(data[:, 2], range_start, range_end)
+        end = np.clip(data[:, 3], range_start, range_end)
+        keep = end > start
+        return cls(data[keep, 0], data[keep, 1], start[keep], end[keep])
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.end - self.start
+
+
+@dataclass
+class Concurrency:
+    times: np.ndarray
+    users: np.ndarray
+
+    @property
+    def peak(self) -> tuple[int, int]:
+        if not len(self.users):
+            return 0, 0
+        index = int(np.argmax(self.users))
+        return int(self.users[index]), int(self.times[index])
+
+    def user_seconds(self, at: np.ndarray) -> np.ndarray:
+        # Число пользователей постоянно между событиями, поэтому накопленные пользователе-секунды кусочно-линейны
+        if not len(self.times):
+            return np.zeros(len(at))
+        accumulated = np.concatenate(([0], np.cumsum(self.users[:-1] * np.diff(self.times))))
+        return np.interp(at, self.times, accumulated)
+
+
+@dataclass
+class Heatmap:
+    users: np.ndarray  # 7x24: среднее число пользователей онлайн (пн-вс, 0-23 ч)
+    concurrency: Concurrency
+    percentiles: dict[int, float]
+    sessions: int
+
+    SHADES = ' ·░▒▓█'
+    WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+    def __str__(self) -> str:
+        scale = self.users.max() or 1
+        levels = np.ceil(self.users / scale * (len(self.SHADES) - 1)).astype(int)
+        lines = ['   0     6     12    18    ']
+        for weekday, row in zip(self.WEEKDAYS, levels):
+            lines.append(f'{weekday} ' + ''.join(self.SHADES[level] for level in row))
+        return '\n'.join(lines)
+
+    def to_embed(self, title: str) -> discord.Embed:
+        embed = discord.Embed(title=title, description=f'```\n{self}\n```', color=discord.Color.light_embed(),
+                              timestamp=discord.utils.utcnow())
+        embed.set_thumbnail(url='https://i.imgur.com/B1awIXx.png')
+        embed.set_footer(text='Информация обновлена')
+        peak, at = self.concurrency.peak
+        embed.add_field(name='Сессий', value=str(self.sessions))
+        embed.add_field(name='Пик онлайна', value=f'{peak} ({discord.utils.format_dt(datetime.datetime.fromtimestamp(at), "f")})' if peak else 'Нет активности.')
+        embed.add_field(name='Самый активный час', value=(
+            f'{self.WEEKDAYS[self.users.argmax() // 24]}, {self.users.argmax() % 24}:00 — {self.users.max():.1f} в среднем'
+            if self.users.max() else 'Нет активности.'
+        ), inline=False)
+        if self.percentiles:
+            embed.add_field(name='Длительность сессий', value='\n'.join(
+                f'p{level}: {templates.time(seconds, display_hour=True)}' for level, seconds in self.percentiles.items()
+            ), inline=False)
+        return embed
+
+
+def concurrency(frame: SessionFrame) -> Concurrency:
+    times = np.concatenate((frame.start, frame.end))
+    deltas = np.concatenate((np.ones(len(frame), dtype=np.int64), -np.ones(len(frame), dtype=np.int64)))
+    order = np.lexsort((deltas, times))
+    times, users = times[order], np.cumsum(deltas[order])
+    # Оставляем последнее значение на каждую отметку времени, чтобы одновременные вход и выход не давали ложных пиков
+    last = np.append(times[1:] != times[:-1], True)
+    return Concurrency(times[last], users[last])
+
+
+def heatmap(frame: SessionFrame, range_start: datetime.datetime, hours: int) -> Heatmap:
+    edges = int(range_start.timestamp()) + 3600 * np.arange(hours + 1, dtype=np.int64)
+    curve = concurrency(frame)
+    per_hour = np.diff(curve.user_seconds(edges)) / 3600
+
+    offsets = range_start.hour + np.arange(hours)
+    hour = offsets % 24
+    weekday = (range_start.weekday() + offsets // 24) % 7
+    totals = np.zeros((7, 24))
+    counts = np.zeros((7, 24))
+    np.add.at(totals, (weekday, hour), per_hour)
+    np.add.at(counts, (weekday, hour), 1)
+
+    levels = (50, 90, 99)
+    percentiles = dict(zip(levels, np.percentile(frame.durations, levels).tolist())) if len(frame) else {}
+    return Heatmap(
+        users=np.divide(totals, counts, out=np.zeros_like(totals), where=counts > 0),
+        concurrency=curve,
+        percentiles=percentiles,
+        sessions=len(frame)
+    )
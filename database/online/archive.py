@@ -0,0 +1,169 @@
+import array
+import asyncio
+import collections
+import json
+import os
+import sys
+import zlib
+
+MAGIC = b'RVOA1\n'
+COLUMNS = (('user_id', 'q'), ('guild_id', 'q'), ('channel_id', 'q'), ('name', 'i'),
+           ('date', 'i'), ('seconds', 'q'), ('is_counting', 'b'))
+
+
+class ArchiveMonth:
+    def __init__(self, columns: dict[str, array.array], names: list[str]):
+        self.columns = columns
+        self.names = names
+        self.index: dict[tuple[int, int], list[int]] = {}
+        for position, key in enumerate(zip(columns['guild_id'], columns['user_id'])):
+            self.index.setdefault(key, []).append(position)
+
+    def __len__(self) -> int:
+        return len(self.columns['date'])
+
+    def row(self, position: int) -> tuple:
+        c = self.columns
+        return (c['user_id'][position], c['guild_id'][position], c['channel_id'][position],
+                self.names[c['name'][position]], c['date'][position], c['seconds'][position],
+                c['is_counting'][position])
+
+    def rows(self) -> list[tuple]:
+        return [self.row(position) for position in range(len(self))]
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple]) -> 'ArchiveMonth':
+        names: dict[str, int] = {}
+        columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+        for user_id, guild_id, channel_id, channel_name, date, seconds, is_counting in rows:
+            columns['user_id'].append(user_id)
+            columns['guild_id'].append(guild_id)
+            columns['channel_id'].append(channel_id)
+            columns['name'].append(names.setdefault(channel_name or '', len(names)))
+            columns['date'].append(date)
+            columns['seconds'].append(round(seconds))
+            columns['is_counting'].append(int(bool(is_counting)))
+        return cls(columns, list(names))
+
+    def dumps(self) -> bytes:
+        header = {'rows': len(self), 'byteorder': sys.byteorder, 'names': self.names,
+                  'columns': [[name, typecode] for name, typecode in COLUMNS]}
+        payload = json.dumps(header, ensure_ascii=False).encode() + b'\n'
+        payload += b''.join(self.columns[name].tobytes() for name, _ in COLUMNS)
+        return MAGIC + zlib.compress(payload, 9)
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'ArchiveMonth':
+        if not data.startswith(MAGIC):
+            raise ValueError('Not an online archive file')
+        payload = zlib.decompress(data[len(MAGIC):])
+        header_end = payload.index(b'\n')
+        header = json.loads(payload[:header_end])
+        offset = header_end + 1
+        columns = {}
+        for name, typecode in header['columns']:
+            column = array.array(typecode)
+            size = column.itemsize * header['rows']
+            column.frombytes(payload[offset:offset + size])
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            columns[name] = column
+            offset += size
+        return cls(columns, header['names'])
+
+
+class OnlineArchive:
+    def __init__(self, path: str, cache_size: int = 6):
+        self.path = path
+        self.cache_size = cache_size
+        self.months: set[int] = set()
+        self._cache: collections.OrderedDict[int, ArchiveMonth] = collections.OrderedDict()
+
+    def open(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        self.months = {int(name[:-5]) for name in os.listdir(self.path)
+                       if name.endswith('.rvoa') and name[:-5].isdigit()}
+
+    def _file(self, month: int) -> str:
+        return os.path.join(self.path, f'{month}.rvoa')
+
+    async def load(self, month: int) -> ArchiveMonth | None:
+        if month not in self.months:
+            return None
+        if month in self._cache:
+            self._cache.move_to_end(month)
+            return self._cache[month]
+
+        def read():
+            with open(self._file(month), 'rb') as file:
+                return ArchiveMonth.loads(file.read())
+
+        archived = await asyncio.to_thread(read)
+        self._cache[month] = archived
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return archived
+
+    async def prepare(self, month: int, rows: list[tuple]) -> tuple[int, int]:
+        merged = {}
+        existing = await self.load(month)
+        for row in (existing.rows() if existing else []) + list(rows):
+            key = (row[0], row[1], row[2], row[4])
+            if key in merged:
+                merged[key] = merged[key][:5] + (merged[key][5] + row[5], row[6])
+            else:
+                merged[key] = row
+        archived = ArchiveMonth.from_rows(list(merged.values()))
+        data = archived.dumps()
+
+        def dump():
+            with open(self._file(month) + '.tmp', 'wb') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+
+        await asyncio.to_thread(dump)
+        return zlib.crc32(data), len(archived)
+
+    def commit(self, month: int) -> None:
+        os.replace(self._file(month) + '.tmp', self._file(month))
+        self.months.add(month)
+        self._cache.pop(month, None)
+
+    def recover(self, committed: dict[int, int]) -> None:
+        # .tmp остаётся, если бот упал между подготовкой файла и фиксацией: доводим до конца только записанные в журнал
+        for name in os.listdir(self.path):
+            if not name.endswith('.rvoa.tmp'):
+                continue
+            month = int(name.split('.')[0])
+            with open(os.path.join(self.path, name), 'rb') as file:
+                crc = zlib.crc32(file.read())
+            if committed.get(month) == crc:
+                self.commit(month)
+            else:
+                os.remove(os.path.join(self.path, name))
+
+    async def select(self, months: set[int], guild_id: int, user_ids: set[int] | None,
+                     day_from: int | None, day_to: int | None, is_open: bool) -> list[tuple]:
+        rows = []
+        for month in sorted(months & self.months):
+            archived = await self.load(month)
+            if user_ids is None:
+                positions = [p for key, found in archived.index.items() if key[0] == guild_id for p in found]
+            else:
+                positions = [p for user_id in user_ids for p in archived.index.get((guild_id, user_id), ())]
+            for position in positions:
+                row = archived.row(position)
+                if day_from is not None and not day_from <= row[4] <= day_to:
+                    continue
+                if is_open and not row[6]:
+                    continue
+                rows.append(row)
+        return rows
+
+    async def totals(self, month: int) -> list[tuple]:
+        totals = {}
+        for user_id, guild_id, _, _, date, seconds, is_counting in (await self.load(month)).rows():
+            key = (month, guild_id, user_id, is_counting)
+            totals[key] = totals.get(key, 0) + seconds
+        return [key + (seconds,) for key, seconds in totals.items()]
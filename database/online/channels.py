@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from typing import Callable
+
+import discord
+
+
+@dataclass
+class Channel:
+    channel_id: int
+    guild_id: int
+    name: str
+    is_counting: bool
+
+
+class ChannelDirectory:
+    def __init__(self, channels: list[Channel]) -> None:
+        self._channels = {channel.channel_id: channel for channel in channels}
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def get(self, channel_id: int) -> Channel | None:
+        return self._channels.get(channel_id)
+
+    def name(self, channel_id: int, default: str = None) -> str:
+        channel = self._channels.get(channel_id)
+        if channel is not None:
+            return channel.name
+        return default or f'#{channel_id}'
+
+    def observe(self, channel_id: int, guild_id: int, name: str, is_counting: bool) -> bool:
+        known = self._channels.get(channel_id)
+        if known is not None and known.name == name and known.is_counting == bool(is_counting):
+            return False
+        self._channels[channel_id] = Channel(channel_id, guild_id, name, bool(is_counting))
+        return True
+
+
+class ClassificationCache:
+    def __init__(self, classify: Callable[[discord.VoiceChannel | discord.StageChannel], bool]) -> None:
+        self._classify = classify
+        self._guilds: dict[int, dict[int, bool]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(channels) for channels in self._guilds.values())
+
+    def get(self, channel: discord.VoiceChannel | discord.StageChannel) -> bool:
+        cached = self._guilds.get(channel.guild.id, {}).get(channel.id)
+        if cached is None:
+            cached = self.refresh(channel)
+        return cached
+
+    def guild(self, guild_id: int) -> dict[int, bool]:
+        return dict(self._guilds.get(guild_id, {}))
+
+    def refresh(self, channel: discord.VoiceChannel | discord.StageChannel) -> bool:
+        counting = self._guilds.setdefault(channel.guild.id, {})[channel.id] = self._classify(channel)
+        return counting
+
+    def forget(self, channel: discord.abc.GuildChannel) -> bool | None:
+        return self._guilds.get(channel.guild.id, {}).pop(channel.id, None)
@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Literal, TypeVar
+
+
+@dataclass
+class VoiceEvent:
+    kind: Literal['join', 'leave', 'close']
+    user_id: int
+    guild_id: int
+    channel_id: int
+    at: int
+    is_counting: bool = False
+    join_time: int = None
+    credited_until: int = None
+
+
+@dataclass
+class ChannelEvent:
+    channel_id: int
+    guild_id: int
+    name: str
+    is_counting: bool
+    at: int
+    reason: str = None
+    kind: Literal['channel'] = 'channel'
+
+
+@dataclass
+class CreditEvent:
+    user_id: int
+    guild_id: int
+    segments: list[tuple[int, int, int, int, bool]]  # channel_id, начало, начислено до, конец, is_counting
+    kind: Literal['credit'] = 'credit'
+
+
+@dataclass
+class CheckpointEvent:
+    at: int
+    sessions: list[tuple[int, int, int, int, bool]]  # user_id, guild_id, channel_id, начислено до, is_counting
+    kind: Literal['checkpoint'] = 'checkpoint'
+
+
+type OnlineEvent = VoiceEvent | ChannelEvent | CreditEvent | CheckpointEvent
+
+T = TypeVar('T')
+
+
+def coalesce(events: list[VoiceEvent]) -> list[OnlineEvent]:
+    # Переходы одного участника за окно: каждый закрытый отрезок начисляется как есть,
+    # а в current_online попадает только итоговое состояние
+    result: list[OnlineEvent] = []
+    segments = [(event.channel_id, event.join_time, event.credited_until, event.at, event.is_counting)
+                for event in events if event.kind == 'leave' and event.at > event.join_time]
+    if segments:
+        result.append(CreditEvent(user_id=events[0].user_id, guild_id=events[0].guild_id, segments=segments))
+
+    last = events[-1]
+    if last.kind == 'join':
+        result.append(last)
+    elif events[0].kind != 'join':
+        result.append(VoiceEvent(kind='close', user_id=last.user_id, guild_id=last.guild_id,
+                                 channel_id=last.channel_id, at=last.at))
+    return result
+
+
+class VoiceEventQueue:
+    def __init__(self, apply: Callable[[list[OnlineEvent]], Awaitable[None]], *,
+                 batch_size: int, flush_interval: float, coalesce_window: float = 0,
+                 retries: int = 5, max_delay: float = 60.0):
+        self._apply = apply
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.coalesce_window = coalesce_window
+        self.retries = retries
+        self.max_delay = max_delay
+        self._failures = 0
+        self._pending: list[OnlineEvent] = []
+        self._failed: list[OnlineEvent] = []
+        self._held: dict[tuple[int, int], tuple[float, list[VoiceEvent]]] = {}
+        self._lock = asyncio.Lock()
+        # Номер записи: нечётный, пока пачка пишется в хранилище
+        self._sequence = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+        self._exclusive = False
+
+    def __len__(self) -> int:
+        return len(self._failed) + len(self._pending) + sum(len(events) for _, events in self._held.values())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, event: OnlineEvent) -> None:
+        # Пока очередь занята исключительно, переходы придерживаются целиком: владелец блокировки может дописать в них поля
+        if event.kind in ('join', 'leave') and (self.coalesce_window > 0 or self._exclusive):
+            self._held.setdefault((event.guild_id, event.user_id), (time.monotonic(), []))[1].append(event)
+            return
+        if event.kind in ('join', 'leave'):
+            self._pending.extend(coalesce([event]))
+        else:
+            self._pending.append(event)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _release(self, everything: bool = False) -> None:
+        deadline = time.monotonic() - self.coalesce_window
+        for key, (since, events) in list(self._held.items()):
+            if everything or since <= deadline:
+                del self._held[key]
+                self._pending.extend(coalesce(events))
+
+    @property
+    def _backoff(self) -> float:
+        return min(self.flush_interval * 2 ** self._failures, self.max_delay)
+
+    async def _run(self) -> None:
+        while not self._closed:
+            if self._failures:
+                # После ошибки записи пауза не прерывается заполнением пачки
+                await asyncio.sleep(self._backoff)
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            async with self._lock:
+                self._release()
+                await self._apply_pending()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            self._release(everything=True)
+            await self._apply_pending()
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        async with self._lock:
+            self._release(everything=True)
+            await self._apply_pending()
+            self._exclusive = True
+            try:
+                yield
+            finally:
+                self._exclusive = False
+
+    @contextlib.asynccontextmanager
+    async def writing(self):
+        self._sequence += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._sequence += 1
+            self._idle.set()
+
+    def _unwritten(self, guild_id: int | None, user_ids: set[int] | None) -> list[tuple]:
+        held = [event for (held_guild, user_id), (_, events) in self._held.items()
+                if guild_id in (None, held_guild) and (user_ids is None or user_id in user_ids)
+                for event in coalesce(events)]
+        return [(event.user_id, event.guild_id, segment) for event in self._failed + self._pending + held
+                if event.kind == 'credit' and guild_id in (None, event.guild_id)
+                and (user_ids is None or event.user_id in user_ids) for segment in event.segments]
+
+    async def read(self, load: Callable[[], Awaitable[T]], guild_id: int | None,
+                   user_ids: set[int] | None = None) -> tuple[T, list[tuple]]:
+        # Чтение не держит блокировку записи: закрытые, но не записанные отрезки копируются до запроса,
+        # а если за время запроса записалась пачка, они могли попасть и в хранилище - запрос повторяется
+        while True:
+            while self._sequence % 2:
+                await self._idle.wait()
+            sequence, unwritten = self._sequence, self._unwritten(guild_id, user_ids)
+            result = await load()
+            if self._sequence == sequence:
+                return result, unwritten
+
+    async def _apply_pending(self) -> None:
+        # Неудачная пачка повторяется отдельно и без изменений: хранилище без транзакций узнаёт её по содержимому
+        while self._failed or self._pending:
+            if self._failed:
+                batch, self._failed = self._failed, []
+            else:
+                batch, self._pending = self._pending, []
+            try:
+                async with self.writing():
+                    await self._apply(batch)
+            except Exception:
+                self._failures += 1
+                if self._failures < self.retries:
+                    logging.exception(f'Failed to apply {len(batch)} voice events, retry {self._failures}/{self.retries - 1} '
+                                      f'in {self._backoff:.0f}s')
+                    self._failed = batch
+                    return
+                logging.exception(f'Dropped {len(batch)} voice events after {self._failures} failed attempts: {batch}')
+            self._failures = 0
+
+    async def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        while self._failed or self._pending:
+            await asyncio.sleep(self._backoff)
+            await self.flush()
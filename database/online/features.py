@@ -1,4 +1,5 @@
 import datetime
+import time
 
 import discord
 
@@ -14,31 +15,49 @@ def is_counting(channel: discord.VoiceChannel) -> bool:
     return False
 
 
-def get_dict_of_time_intervals(start_date, end_date):
-    delta = end_date - start_date
+def to_day(date: str | datetime.date) -> int:
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return date.toordinal()
+
+
+def from_day(day: int) -> str:
+    return datetime.date.fromordinal(day).isoformat()
+
+
+def to_month(day: int) -> int:
+    date = datetime.date.fromordinal(day)
+    return date.year * 100 + date.month
+
+
+def month_bounds(month: int) -> tuple[int, int]:
+    year, month = divmod(month, 100)
+    first = datetime.date(year, month, 1)
+    last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return first.toordinal(), last.toordinal()
+
+
+def months_between(day_from: int, day_to: int) -> set[int]:
+    months = set()
+    while day_from <= day_to:
+        months.add(to_month(day_from))
+        day_from = month_bounds(to_month(day_from))[1] + 1
+    return months
+
+
+def split_by_days(start: int, end: int) -> dict[int, int]:
     result = {}
-    current_date = start_date.date()
-    while current_date <= end_date.date():
-        if current_date == start_date.date() == end_date.date():
-            seconds_in_date = delta.total_seconds()
-        elif current_date == start_date.date():
-            seconds_in_date = (
-                    datetime.datetime.combine(current_date, datetime.datetime.max.time()) - start_date
-            ).total_seconds()
-        elif current_date == end_date.date():
-            seconds_in_date = (
-                    end_date - datetime.datetime.combine(current_date, datetime.datetime.min.time())
-            ).total_seconds()
-        else:
-            seconds_in_date = 24 * 3600
-        result[current_date.strftime('%Y-%m-%d')] = seconds_in_date
-        current_date += datetime.timedelta(days=1)
+    while start < end:
+        moment = datetime.datetime.fromtimestamp(start)
+        next_day = datetime.datetime.combine(moment.date() + datetime.timedelta(days=1), datetime.time.min)
+        boundary = min(end, int(next_day.timestamp()))
+        result[moment.toordinal()] = result.get(moment.toordinal(), 0) + boundary - start
+        start = boundary
     return result
 
 
-def mashup_info(all_online, current_online, date):
-    join_time = datetime.datetime.strptime(current_online['join_time'], '%Y-%m-%d %H:%M:%S')
-    seconds = get_dict_of_time_intervals(join_time, datetime.datetime.now()).get(date, 0)
+def mashup_info(all_online, current_online, day: int):
+    seconds = split_by_days(current_online['credited_until'], int(time.time())).get(day, 0)
     if seconds == 0:
         return all_online
 
@@ -52,7 +71,7 @@ def mashup_info(all_online, current_online, date):
             "guild_id": current_online['guild_id'],
             "channel_id": current_online['channel_id'],
             "channel_name": current_online['channel_name'],
-            "date": date,
+            "date": from_day(day),
             "seconds": seconds,
             "is_counting": current_online['is_counting']
         })
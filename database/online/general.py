@@ -1,23 +1,62 @@
+import asyncio
 import datetime
-import aiosqlite
+import logging
+import time
+from typing import Iterable
+
 import discord
+from motor.motor_asyncio import AsyncIOMotorClient as MotorClient
 
+import config
 from core import templates
-from database.online.features import get_dict_of_time_intervals, mashup_info, seconds_to_time
+from database.cache import ReadModelCache
+from database.online import analytics
+from database.online.channels import ChannelDirectory, ClassificationCache
+from database.online.events import ChannelEvent, CheckpointEvent, VoiceEvent, VoiceEventQueue
+from database.online.features import from_day, is_counting, mashup_info, seconds_to_time, split_by_days, to_day, to_month
+from database.online.leaderboard import Leaderboard, Period
+from database.online.maintenance import MaintenanceStep
+from database.online.reconcile import LiveSessions, ReconcileReport
+from database.online.storage import BACKENDS, OnlineStorage, create_storage
 
 
 class CurrentInfo:
     def __init__(self, current_users) -> None:
-        self.current_users = current_users
+        self._by_member: dict[tuple[int, int], dict] = {}
+        self._by_channel: dict[int, set[int]] = {}
+        for user in current_users:
+            self.add(user)
+
+    def __len__(self) -> int:
+        return len(self._by_member)
+
+    def __iter__(self):
+        return iter(list(self._by_member.values()))
+
+    def add(self, session: dict) -> None:
+        self.pop(session['user_id'], session['guild_id'])
+        self._by_member[(session['guild_id'], session['user_id'])] = session
+        self._by_channel.setdefault(session['channel_id'], set()).add(session['user_id'])
+
+    def pop(self, user_id: int, guild_id: int) -> dict | None:
+        session = self._by_member.pop((guild_id, user_id), None)
+        if session is not None:
+            users = self._by_channel[session['channel_id']]
+            users.discard(user_id)
+            if not users:
+                del self._by_channel[session['channel_id']]
+        return session
+
+    def get(self, user_id: int, guild_id: int) -> dict | None:
+        return self._by_member.get((guild_id, user_id))
 
     def in_channel(self, user_id, guild_id):
-        for user in self.current_users:
-            if user['user_id'] == user_id and user['guild_id'] == guild_id:
-                return user['channel_id'], user['channel_name']
-        return False
+        if (session := self.get(user_id, guild_id)) is None:
+            return False
+        return session['channel_id'], session['channel_name']
 
-    def get_channel_users(self, channel_id):
-        return [user['user_id'] for user in self.current_users if user['channel_id'] == channel_id]
+    def get_channel_users(self, channel_id) -> list[int]:
+        return list(self._by_channel.get(channel_id, ()))
 
 
 class ChannelInfo:
@@ -66,152 +105,311 @@ class DateInfo:
         return {'name': "Время в каналах", 'value': str(self), 'inline': False}
 
 class OnlineDatabase:
-    def __init__(self, db_path):
+    def __init__(self, db_path, client: MotorClient = None, backend: str = config.online_backend, cache: ReadModelCache = None):
         self.db_path = db_path
-        self.db = None  # Инициализируем переменную для хранения соединения
+        self.cache = cache or ReadModelCache(config.read_cache_size, config.read_cache_ttl)
+        self._client = client
+        self.storage = create_storage(backend, db_path, client)
+        self.current = CurrentInfo([])
+        self.channels = ChannelDirectory([])
+        self.classification = ClassificationCache(is_counting)
+        self.checkpointed_at: int | None = None
+        self._checkpointing: set[int] = set()
+        self._deferred_leaves: list[tuple[dict, VoiceEvent]] = []
+        self.leaderboard = Leaderboard()
+        self.events = VoiceEventQueue(
+            self.storage.apply, batch_size=config.online_batch_size, flush_interval=config.online_flush_interval,
+            coalesce_window=config.online_coalesce_window, retries=config.online_apply_retries,
+            max_delay=config.online_retry_max_delay
+        )
 
     async def init_db(self):
-        self.db = await aiosqlite.connect(self.db_path)  # Устанавливаем соединение
-        await self.db.execute('''CREATE TABLE IF NOT EXISTS current_online (
-                                user_id INTEGER, guild_id INTEGER, channel_id INTEGER, 
-                                channel_name TEXT, join_time TEXT, is_counting BOOLEAN)''')
-        await self.db.execute('''CREATE TABLE IF NOT EXISTS all_online (
-                                user_id INTEGER, guild_id INTEGER, channel_id INTEGER, 
-                                channel_name TEXT, date TEXT, seconds INTEGER, is_counting BOOLEAN,
-                                UNIQUE(user_id, guild_id, channel_id, date))''')  # Уникальное ограничение добавлено
-        await self.db.commit()
+        await self.storage.open()
+        self.channels = ChannelDirectory(await self.storage.load_channels())
+        self.current = CurrentInfo(await self.get_current_users())
+        today = datetime.date.today().toordinal()
+        self.leaderboard.load(await self.storage.day_totals(Leaderboard.week_start(today), today))
+        # Сессии из прошлого запуска закрываются на последнем чекпоинте, живые откроет reconcile
+        stale = list(self.current)
+        for session in stale:
+            self._close_session(session['user_id'], session['guild_id'], session['credited_until'])
+        if stale:
+            logging.info(f'Closed {len(stale)} voice sessions at their last checkpoint')
+        self.events.start()
 
     async def close_db(self):
-        if self.db is not None:
-            await self.db.close()  # Закрываем соединение
+        try:
+            await self.checkpoint()
+        except Exception:
+            logging.exception('Failed to checkpoint voice sessions on shutdown')
+        finally:
+            try:
+                await self.events.close()
+            finally:
+                await self.storage.close()
 
     async def get_current_info(self):
-        return CurrentInfo(await self.get_current_users())
+        return self.current
 
     async def get_current_users(self):
-        cursor = await self.db.execute("SELECT * FROM current_online")
-        return [{'user_id': row[0], 'guild_id': row[1], 'channel_id': row[2], 'channel_name': row[3],
-                 'join_time': row[4], 'is_counting': row[5]} for row in await cursor.fetchall()]
-
-    async def pop_current_info(self, user_id: int, channel_id: int):
-        cursor = await self.db.execute("SELECT * FROM current_online WHERE user_id = ? AND channel_id = ?",
-                                        (user_id, channel_id))
-        current_info = await cursor.fetchone()
-        if not current_info:
-            return None
-        await self.db.execute("DELETE FROM current_online WHERE user_id = ? AND channel_id = ?",
-                             (user_id, channel_id))
-        await self.db.commit()
-        return {'user_id': current_info[0], 'guild_id': current_info[1], 'channel_id': current_info[2],
-                'channel_name': current_info[3], 'join_time': current_info[4], 'is_counting': current_info[5]}
-
-    async def add_join_info(self, member: discord.Member, channel, is_counting: bool):
-        await self.db.execute('''INSERT INTO current_online (user_id, guild_id, channel_id, channel_name, 
-                            join_time, is_counting) VALUES (?, ?, ?, ?, ?, ?)''',
-                             (member.id, member.guild.id, channel.id, channel.name,
-                              datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), is_counting))
-        await self.db.commit()
-
-    async def add_leave_info(self, member: discord.Member, channel):
-        now = datetime.datetime.now()
-        current_info = await self.pop_current_info(member.id, channel.id)
-        if not current_info:
+        return [{'user_id': row[0], 'guild_id': row[1], 'channel_id': row[2], 'channel_name': self.channels.name(row[2]),
+                 'join_time': row[3], 'is_counting': row[4], 'credited_until': row[5]} for row in await self.storage.load_current()]
+
+    def add_join_info(self, member: discord.Member, channel, is_counting: bool) -> None:
+        now = int(time.time())
+        if self.current.get(member.id, member.guild.id) is not None:
+            self._close_session(member.id, member.guild.id, now)
+        self._open_session(member.id, member.guild.id, channel, is_counting, now)
+
+    def add_leave_info(self, member: discord.Member, channel) -> None:
+        session = self.current.get(member.id, member.guild.id)
+        if session is None or session['channel_id'] != channel.id:
             return
+        self._close_session(member.id, member.guild.id, int(time.time()))
 
-        intervals: dict[str, int] = get_dict_of_time_intervals(
-            datetime.datetime.strptime(current_info['join_time'], '%Y-%m-%d %H:%M:%S'), now)
-
-        for date, seconds in intervals.items():
-            await self.db.execute('''INSERT INTO all_online (user_id, guild_id, channel_id, channel_name, date, 
-                            seconds, is_counting) 
-                            VALUES (?, ?, ?, ?, ?, ?, ?) 
-                            ON CONFLICT(user_id, guild_id, channel_id, date) 
-                            DO UPDATE SET seconds = seconds + ?, is_counting = ?''',
-                                 (member.id, member.guild.id, channel.id, channel.name, date,
-                                  seconds, current_info['is_counting'], seconds, current_info['is_counting']))
-        await self.db.commit()
+    def observe_channel(self, channel, is_counting: bool, reason: str = 'join') -> None:
+        if not self.channels.observe(channel.id, channel.guild.id, channel.name, is_counting):
+            return
+        for user_id in self.current.get_channel_users(channel.id):
+            self.current.get(user_id, channel.guild.id)['channel_name'] = channel.name
+        self.events.put(ChannelEvent(channel_id=channel.id, guild_id=channel.guild.id, name=channel.name,
+                                     is_counting=is_counting, at=int(time.time()), reason=reason))
+
+    def classify_channel(self, channel, reason: str) -> bool:
+        counting = self.classification.refresh(channel)
+        self.observe_channel(channel, counting, reason)
+        return counting
+
+    def forget_channel(self, channel) -> None:
+        self.classification.forget(channel)
+        self.channels.observe(channel.id, channel.guild.id, channel.name, False)
+        self.events.put(ChannelEvent(channel_id=channel.id, guild_id=channel.guild.id, name=channel.name,
+                                     is_counting=False, at=int(time.time()), reason='delete'))
+
+    def _close_session(self, user_id: int, guild_id: int, at: int) -> None:
+        session = self.current.pop(user_id, guild_id)
+        self.cache.invalidate(('online', guild_id, user_id))
+        event = VoiceEvent(
+            kind='leave', user_id=user_id, guild_id=guild_id, channel_id=session['channel_id'], at=at,
+            is_counting=session['is_counting'], join_time=session['join_time'], credited_until=session['credited_until']
+        )
+        if id(session) in self._checkpointing:
+            # Выход встаёт в очередь на своё место, а начало его начисления проставит чекпоинт, когда станет ясно, записался ли он
+            self._deferred_leaves.append((session, event))
+        else:
+            self.leaderboard.credit(session, at)
+        self.events.put(event)
+
+    def _open_session(self, user_id: int, guild_id: int, channel, is_counting: bool, at: int) -> None:
+        self.observe_channel(channel, is_counting)
+        session = {'user_id': user_id, 'guild_id': guild_id, 'channel_id': channel.id,
+                   'channel_name': channel.name, 'join_time': at,
+                   'is_counting': is_counting, 'credited_until': at}
+        self.current.add(session)
+        self.cache.invalidate(('online', guild_id, user_id))
+        self.events.put(VoiceEvent(
+            kind='join', user_id=user_id, guild_id=guild_id, channel_id=channel.id,
+            at=at, is_counting=is_counting, join_time=session['join_time'], credited_until=at
+        ))
+
+    async def reconcile(self, live: LiveSessions) -> ReconcileReport:
+        started = time.perf_counter()
+        now = int(time.time())
+        opened = closed = 0
+
+        for session in self.current:
+            target = live.get((session['guild_id'], session['user_id']))
+            if target is None or target[0].id != session['channel_id']:
+                self._close_session(session['user_id'], session['guild_id'], now)
+                closed += 1
+
+        for (guild_id, user_id), (channel, counting) in live.items():
+            if self.current.get(user_id, guild_id) is None:
+                self._open_session(user_id, guild_id, channel, counting, now)
+                opened += 1
+
+        await self.events.flush()
+        return ReconcileReport(opened=opened, closed=closed, elapsed=time.perf_counter() - started)
+
+    async def checkpoint(self) -> int:
+        async with self.events.exclusive():
+            now = int(time.time())
+            sessions = [session for session in self.current if session['credited_until'] < now]
+            if not sessions:
+                return 0
+            event = CheckpointEvent(at=now, sessions=[
+                (session['user_id'], session['guild_id'], session['channel_id'], session['credited_until'], session['is_counting'])
+                for session in sessions
+            ])
+            # Маркеры сдвигаются только после успешной записи, иначе следующий чекпоинт начислит этот отрезок заново
+            self._checkpointing = {id(session) for session in sessions}
+            written = False
+            async with self.events.writing():
+                try:
+                    await self._write_checkpoint(event)
+                    written = True
+                finally:
+                    self._checkpointing = set()
+                    if written:
+                        for session in sessions:
+                            self.leaderboard.credit(session, now)
+                            session['credited_until'] = now
+                        self.checkpointed_at = now
+                    deferred, self._deferred_leaves = self._deferred_leaves, []
+                    for session, leave in deferred:
+                        leave.credited_until = session['credited_until']
+                        self.leaderboard.credit(session, leave.at)
+        return len(sessions)
+
+    async def _write_checkpoint(self, event: CheckpointEvent) -> None:
+        # Повторяется тот же чекпоинт без изменений, хранилище без транзакций не начислит уже записанную часть дважды
+        for attempt in range(1, self.events.retries + 1):
+            try:
+                return await self.storage.apply([event])
+            except Exception:
+                if attempt == self.events.retries:
+                    raise
+                logging.exception(f'Failed to write voice checkpoint, retry {attempt}/{self.events.retries - 1}')
+                await asyncio.sleep(min(self.events.flush_interval * 2 ** attempt, self.events.max_delay))
+
+    async def _select_online(self, user_ids: set[int], guild_id: int, day_from: int | None, day_to: int | None, is_open: bool) -> list[dict]:
+        rows = await self.storage.select_online(user_ids, guild_id, day_from, day_to, is_open)
+        return [{'user_id': row[0], 'guild_id': row[1], 'channel_id': row[2], 'channel_name': self.channels.name(row[2], row[3]),
+                 'date': from_day(row[4]), 'seconds': row[5], 'is_counting': row[6]} for row in rows]
+
+    def _overlay(self, rows: list[dict], unwritten: list[tuple], day_from: int | None, day_to: int | None,
+                 is_open: bool) -> list[dict]:
+        # Отрезки из очереди добавляются к прочитанному так же, как их начислит хранилище при записи
+        index = {(row['user_id'], row['date'], row['channel_id']): row for row in rows}
+        for user_id, guild_id, (channel_id, _, credited_until, end, counting) in unwritten:
+            if is_open and not counting:
+                continue
+            for day, seconds in split_by_days(credited_until, end).items():
+                if day_from is not None and not day_from <= day <= day_to:
+                    continue
+                if (row := index.get((user_id, from_day(day), channel_id))) is not None:
+                    row['seconds'] += seconds
+                    continue
+                index[user_id, from_day(day), channel_id] = row = {
+                    'user_id': user_id, 'guild_id': guild_id, 'channel_id': channel_id,
+                    'channel_name': self.channels.name(channel_id), 'date': from_day(day),
+                    'seconds': seconds, 'is_counting': counting
+                }
+                rows.append(row)
+        return rows
 
     async def get_info(self, is_open: bool, user_id: int, guild_id: int, date: str = None):
-        query = "SELECT * FROM all_online WHERE user_id = ? AND guild_id = ?"
-        params = [user_id, guild_id]
-        if date:
-            query += " AND date = ?"
-            params.append(date)
-        if is_open:
-            query += " AND is_counting = ?"
-            params.append(is_open)
-
-        cursor = await self.db.execute(query, params)
-        all_online = [{'user_id': row[0], 'guild_id': row[1], 'channel_id': row[2], 'channel_name': row[3],
-                       'date': row[4], 'seconds': row[5], 'is_counting': row[6]} for row in await cursor.fetchall()]
-
-        query = "SELECT * FROM current_online WHERE user_id = ? AND guild_id = ?"
-        params = [user_id, guild_id]
-        if is_open:
-            query += " AND is_counting = ?"
-            params.append(is_open)
-        cursor = await self.db.execute(query, params)
-        current_online = await cursor.fetchone()
-
-        if current_online:
-            all_online = mashup_info(all_online, {
-                'user_id': current_online[0], 'guild_id': current_online[1], 'channel_id': current_online[2],
-                'channel_name': current_online[3], 'join_time': current_online[4], 'is_counting': current_online[5]
-            }, date)
+        return await self.cache.get(('online.info', guild_id, user_id, is_open, date),
+                                    lambda: self._get_info(is_open, user_id, guild_id, date), [('online', guild_id, user_id)])
+
+    async def _get_info(self, is_open: bool, user_id: int, guild_id: int, date: str = None):
+        day = to_day(date) if date else None
+
+        async def load():
+            current_online = self.current.get(user_id, guild_id)
+            return await self._select_online({user_id}, guild_id, day, day, is_open), current_online
+
+        (all_online, current_online), unwritten = await self.events.read(load, guild_id, {user_id})
+        all_online = self._overlay(all_online, unwritten, day, day, is_open)
+        if current_online and (current_online['is_counting'] or not is_open):
+            all_online = mashup_info(all_online, current_online, day)
         return DateInfo(all_online)
 
     async def get_diapason_info(self, user_id: int, guild_id: int, date_from: datetime.datetime, date_to: datetime.datetime, is_open: bool) -> dict[str, DateInfo]:
-        query = "SELECT * FROM all_online WHERE user_id = ? AND guild_id = ? AND date BETWEEN ? AND ?"
-        params = [user_id, guild_id, date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')]
-        if is_open:
-            query += " AND is_counting = ?"
-            params.append(is_open)
-        cursor = await self.db.execute(query, params)
+        return (await self.get_team_info([user_id], guild_id, date_from, date_to, is_open))[user_id]
 
-        all_online = [{'user_id': row[0], 'guild_id': row[1], 'channel_id': row[2], 'channel_name': row[3],
-                          'date': row[4], 'seconds': row[5], 'is_counting': row[6]} for row in await cursor.fetchall()]
-        dates = {date: [] for date in set(row['date'] for row in all_online)}
+    async def get_team_info(self, user_ids: Iterable[int], guild_id: int, date_from: datetime.date, date_to: datetime.date, is_open: bool) -> dict[int, dict[str, DateInfo]]:
+        user_ids = set(user_ids)
+        day_from, day_to = to_day(date_from), to_day(date_to)
 
-        for row in all_online:
-            dates[row['date']].append(row)
+        async def load():
+            current = {user_id: self.current.get(user_id, guild_id) for user_id in user_ids}
+            return await self._select_online(user_ids, guild_id, day_from, day_to, is_open), current
+
+        team = {user_id: {} for user_id in user_ids}
+        (rows, current), unwritten = await self.events.read(load, guild_id, user_ids)
+        for row in self._overlay(rows, unwritten, day_from, day_to, is_open):
+            team[row['user_id']].setdefault(row['date'], []).append(row)
+
+        now = int(time.time())
+        for user_id, dates in team.items():
+            current_online = current[user_id]
+            if not current_online or not (current_online['is_counting'] or not is_open):
+                continue
+            for day in split_by_days(current_online['credited_until'], now):
+                if day_from <= day <= day_to:
+                    dates[from_day(day)] = mashup_info(dates.get(from_day(day), []), current_online, day)
 
-        if date_to > datetime.datetime.now() > date_from:
-            query = "SELECT * FROM current_online WHERE user_id = ? AND guild_id = ?"
-            params = [user_id, guild_id]
-            if is_open:
-                query += " AND is_counting = ?"
-                params.append(is_open)
-            cursor = await self.db.execute(query, params)
-            current_online = await cursor.fetchall()
+        return {user_id: {date: DateInfo(all_online) for date, all_online in sorted(dates.items())}
+                for user_id, dates in team.items()}
 
-            for row in current_online:
-                dates[datetime.datetime.now().strftime('%Y-%m-%d')] = mashup_info(dates[datetime.datetime.now().strftime('%Y-%m-%d')], {
-                    'user_id': row[0], 'guild_id': row[1], 'channel_id': row[2],
-                    'channel_name': row[3], 'join_time': row[4], 'is_counting': row[5]
-                }, datetime.datetime.now().strftime('%Y-%m-%d'))
+    async def maintain(self, full_analyze: bool = False, convert_vacuum: bool = False) -> list[MaintenanceStep]:
+        return await self.storage.maintain(self.events.exclusive, full_analyze, convert_vacuum)
 
-        return {date: DateInfo(all_online) for date, all_online in dates.items()}
+    def get_live_top(self, guild_id: int, period: Period, k: int = 10) -> list[tuple[int, int]]:
+        return self.leaderboard.top(guild_id, period, self.current, int(time.time()), k)
 
     async def get_top(self, year: int, month: int, is_open: bool, guild_id: int | None = None) -> dict[int, float]:
-        start_date = f"{year}-{str(month).zfill(2)}-01"
-        end_date = f"{year}-{str(month).zfill(2)}-31"
-
-        query = "SELECT user_id, SUM(seconds) as total_seconds FROM all_online WHERE date BETWEEN ? AND ?"
-        params = [start_date, end_date]
-        
-        if guild_id:
-            query += " AND guild_id = ?"
-            params.append(guild_id)
-        if is_open:
-            query += " AND is_counting = ?"
-            params.append(is_open)
-        query += " GROUP BY user_id ORDER BY total_seconds DESC LIMIT 20"
-        
-        cursor = await self.db.execute(query, params)
-
-        top = {row[0]: row[1] for row in await cursor.fetchall()}
-        return top
-
-    def __del__(self):
-        import asyncio
-        asyncio.run(self.close_db())
+        month = year * 100 + month
+        top, unwritten = await self.events.read(lambda: self.storage.top(month, is_open, guild_id), guild_id)
+        for user_id, _, (_, _, credited_until, end, counting) in unwritten:
+            if counting or not is_open:
+                for day, seconds in split_by_days(credited_until, end).items():
+                    if to_month(day) == month:
+                        top[user_id] = top.get(user_id, 0) + seconds
+        return dict(sorted(top.items(), key=lambda item: item[1], reverse=True)[:20])
+
+    async def get_classification_log(self, guild_id: int, limit: int = 10) -> list[tuple[int, bool, str, int]]:
+        # Смены классификации не придерживаются в очереди и попадают в журнал с ближайшей записью пачки
+        return await self.storage.classification_log(guild_id, limit)
+
+    async def get_heatmap(self, guild_id: int, date_from: datetime.date, date_to: datetime.date, is_open: bool, user_id: int = None) -> analytics.Heatmap:
+        range_start = datetime.datetime.combine(date_from, datetime.time.min)
+        range_end = datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min)
+        start, end = int(range_start.timestamp()), int(range_end.timestamp())
+
+        async def load():
+            now = int(time.time())
+            current = [(session['user_id'], session['channel_id'], session['join_time'], now) for session in self.current
+                       if session['guild_id'] == guild_id and (not user_id or session['user_id'] == user_id)
+                       and (session['is_counting'] or not is_open)]
+            return await self.storage.sessions(guild_id, start, end, is_open, user_id) + current, now
+
+        (rows, now), unwritten = await self.events.read(load, guild_id, {user_id} if user_id else None)
+        rows += [(member_id, channel_id, started_at, ended_at)
+                 for member_id, _, (channel_id, started_at, _, ended_at, counting) in unwritten
+                 if ended_at > start and started_at < end and (counting or not is_open)]
+
+        frame = analytics.SessionFrame.from_rows(rows, start, min(end, now))
+        return analytics.heatmap(frame, range_start, max(0, -(-(min(end, now) - start) // 3600)))
+
+    async def rebuild_monthly(self) -> int:
+        async with self.events.exclusive():
+            return await self.storage.rebuild_monthly()
+
+    def _hot_start(self) -> int:
+        today = datetime.date.today()
+        month = today.year * 12 + today.month - config.online_hot_months
+        return datetime.date(month // 12, month % 12 + 1, 1).toordinal()
+
+    async def archive_closed_months(self) -> dict[int, int]:
+        async with self.events.exclusive():
+            return await self.storage.archive_closed_months(self._hot_start())
+
+    async def transfer(self, backend: str) -> dict[str, int]:
+        if backend == self.storage.name or backend not in BACKENDS:
+            raise ValueError(f"Нельзя перенести онлайн из {self.storage.name} в {backend}")
+        target: OnlineStorage = create_storage(backend, self.db_path, self._client)
+        copied = {}
+        await target.open()
+        try:
+            if not await target.empty():
+                raise ValueError(f"Хранилище {backend} уже содержит данные")
+            async with self.events.exclusive():
+                async for kind, rows in self.storage.dump():
+                    await target.load(kind, rows)
+                    copied[kind] = copied.get(kind, 0) + len(rows)
+            copied['monthly'] = await target.rebuild_monthly()
+        finally:
+            await target.close()
+        return copied
@@ -0,0 +1,86 @@
+import bisect
+import datetime
+from typing import Iterable, Literal
+
+from database.online.features import split_by_days
+
+type Period = Literal['day', 'week']
+
+
+class RankedCounter:
+    def __init__(self):
+        self.values: dict[int, int] = {}
+        self._ranked: list[tuple[int, int]] = []  # (-seconds, user_id), по убыванию времени
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, user_id: int, seconds: int) -> None:
+        old = self.values.get(user_id)
+        if old is not None:
+            del self._ranked[bisect.bisect_left(self._ranked, (-old, user_id))]
+        self.values[user_id] = (old or 0) + seconds
+        bisect.insort(self._ranked, (-self.values[user_id], user_id))
+
+    def top(self, k: int, live: dict[int, int] = None) -> list[tuple[int, int]]:
+        # Живые сессии меняют итог только у своих участников, поэтому достаточно k + len(live) лучших начисленных
+        live = live or {}
+        candidates = {user_id: -seconds for seconds, user_id in self._ranked[:k + len(live)]}
+        for user_id, seconds in live.items():
+            candidates[user_id] = self.values.get(user_id, 0) + seconds
+        return sorted(candidates.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class Leaderboard:
+    def __init__(self):
+        self._days: dict[tuple[int, int], RankedCounter] = {}
+        self._weeks: dict[tuple[int, int], RankedCounter] = {}
+        self._week_start = self.week_start(datetime.date.today().toordinal())
+
+    @staticmethod
+    def week_start(day: int) -> int:
+        return day - datetime.date.fromordinal(day).weekday()
+
+    def __len__(self) -> int:
+        return sum(len(counter) for counter in self._weeks.values())
+
+    def _roll(self, today: int) -> None:
+        if self.week_start(today) == self._week_start:
+            return
+        self._week_start = self.week_start(today)
+        self._days = {key: counter for key, counter in self._days.items() if key[1] >= self._week_start}
+        self._weeks = {key: counter for key, counter in self._weeks.items() if key[1] >= self._week_start}
+
+    def add(self, guild_id: int, user_id: int, day: int, seconds: int) -> None:
+        self._roll(datetime.date.today().toordinal())
+        if day < self._week_start or seconds <= 0:
+            return
+        self._days.setdefault((guild_id, day), RankedCounter()).add(user_id, seconds)
+        self._weeks.setdefault((guild_id, self.week_start(day)), RankedCounter()).add(user_id, seconds)
+
+    def credit(self, session: dict, until: int) -> None:
+        if not session['is_counting']:
+            return
+        for day, seconds in split_by_days(session['credited_until'], until).items():
+            self.add(session['guild_id'], session['user_id'], day, seconds)
+
+    def load(self, rows: Iterable[tuple[int, int, int, int]]) -> None:
+        self._days.clear()
+        self._weeks.clear()
+        for guild_id, user_id, day, seconds in rows:
+            self.add(guild_id, user_id, day, seconds)
+
+    def top(self, guild_id: int, period: Period, sessions: Iterable[dict], now: int, k: int = 10) -> list[tuple[int, int]]:
+        today = datetime.date.fromtimestamp(now).toordinal()
+        self._roll(today)
+        first = today if period == 'day' else self._week_start
+        live = {}
+        for session in sessions:
+            if session['guild_id'] != guild_id or not session['is_counting']:
+                continue
+            seconds = sum(seconds for day, seconds in split_by_days(session['credited_until'], now).items() if day >= first)
+            if seconds:
+                live[session['user_id']] = seconds
+
+        counter = (self._days if period == 'day' else self._weeks).get((guild_id, first), RankedCounter())
+        return counter.top(k, live)
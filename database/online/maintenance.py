@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import AsyncContextManager, Callable
+
+import aiosqlite
+
+from database.online.pool import ReadPool
+
+type Exclusive = Callable[[], AsyncContextManager]
+
+
+@dataclass
+class MaintenanceStep:
+    name: str
+    elapsed: float
+    detail: str
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.detail} ({self.elapsed * 1000:.0f}ms)'
+
+
+class _Timer:
+    def __init__(self, name: str, steps: list[MaintenanceStep]):
+        self.name = name
+        self.steps = steps
+        self.detail = ''
+
+    def __enter__(self) -> '_Timer':
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback) -> bool:
+        if error is not None:
+            logging.error(f'Online maintenance step {self.name} failed', exc_info=(kind, error, traceback))
+        detail = self.detail if error is None else f'ошибка: {error}'
+        self.steps.append(MaintenanceStep(self.name, time.perf_counter() - self._started, detail))
+        return isinstance(error, (Exception, type(None)))
+
+
+def _prune_backups(path: str, keep: int) -> None:
+    backups = sorted(name for name in os.listdir(path) if name.startswith('online-') and name.endswith('.sqlite'))
+    for name in backups[:-keep]:
+        os.remove(os.path.join(path, name))
+
+
+def _integrity_check(path: str) -> str:
+    connection = sqlite3.connect(path)
+    try:
+        return ', '.join(row[0] for row in connection.execute('PRAGMA integrity_check'))
+    finally:
+        connection.close()
+
+
+async def backup(source: aiosqlite.Connection, path: str, keep: int) -> tuple[str, str]:
+    # Снимок из отдельного соединения для чтения: в WAL запись не ждёт, пока копируются страницы
+    os.makedirs(path, exist_ok=True)
+    file = os.path.join(path, f'online-{datetime.datetime.now():%Y%m%d-%H%M%S}.sqlite')
+    target = sqlite3.connect(file + '.tmp', check_same_thread=False)
+    try:
+        await source.backup(target, pages=-1)
+    finally:
+        target.close()
+    os.replace(file + '.tmp', file)
+    await asyncio.to_thread(_prune_backups, path, keep)
+    return file, await asyncio.to_thread(_integrity_check, file)
+
+
+async def quick_check(connection: aiosqlite.Connection) -> str:
+    cursor = await connection.execute('PRAGMA quick_check')
+    return ', '.join(row[0] for row in await cursor.fetchall())
+
+
+async def optimize(db: aiosqlite.Connection, full: bool) -> str:
+    await db.execute('ANALYZE' if full else 'PRAGMA optimize')
+    await db.commit()
+    return 'ANALYZE' if full else 'PRAGMA optimize'
+
+
+async def incremental_vacuum(db: aiosqlite.Connection, exclusive: Exclusive, pages: int, convert: bool) -> str:
+    cursor = await db.execute('PRAGMA auto_vacuum')
+    (mode,) = await cursor.fetchone()
+    if mode != 2 and not convert:
+        return 'база не в режиме auto_vacuum = INCREMENTAL, перевод: /online-admin maintenance перевести-vacuum'
+    if mode != 2:
+        # Режим меняется только полным VACUUM: файл переписывается целиком, и всё это время запись событий стоит
+        async with exclusive():
+            await db.commit()
+            await db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            await db.execute('VACUUM')
+        return 'база переведена в auto_vacuum = INCREMENTAL'
+
+    freed = 0
+    while True:
+        async with exclusive():
+            cursor = await db.execute('PRAGMA freelist_count')
+            (free,) = await cursor.fetchone()
+            if not free:
+                break
+            await (await db.execute(f'PRAGMA incremental_vacuum({pages})')).fetchall()
+            await db.commit()
+            freed += min(free, pages)
+        await asyncio.sleep(0.05)  # Между порциями очередь успевает записать накопленные события
+    return f'освобождено страниц: {freed}'
+
+
+async def run(db: aiosqlite.Connection, reads: ReadPool, exclusive: Exclusive, *, backup_path: str, backup_keep: int,
+              vacuum_pages: int, full_analyze: bool, convert_vacuum: bool = False) -> list[MaintenanceStep]:
+    steps = []
+    with _Timer('quick_check', steps) as step:
+        async with reads.acquire() as connection:
+            step.detail = await quick_check(connection)
+    with _Timer('backup', steps) as step:
+        async with reads.acquire() as connection:
+            file, integrity = await backup(connection, backup_path, backup_keep)
+        step.detail = f'{os.path.basename(file)}, integrity_check: {integrity}'
+    with _Timer('optimize', steps) as step:
+        async with exclusive():
+            step.detail = await optimize(db, full_analyze)
+    with _Timer('incremental_vacuum', steps) as step:
+        step.detail = await incremental_vacuum(db, exclusive, vacuum_pages, convert_vacuum)
+    return steps
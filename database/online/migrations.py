@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+import sys
+import time
+
+import aiosqlite
+
+
+# Модуль запускается и отдельным скриптом, поэтому не импортирует пакет database: разбиение по дням повторяет features
+def _split_by_days(start: int, end: int) -> dict[int, int]:
+    result = {}
+    while start < end:
+        moment = datetime.datetime.fromtimestamp(start)
+        next_day = datetime.datetime.combine(moment.date() + datetime.timedelta(days=1), datetime.time.min)
+        boundary = min(end, int(next_day.timestamp()))
+        result[moment.toordinal()] = result.get(moment.toordinal(), 0) + boundary - start
+        start = boundary
+    return result
+
+
+async def _baseline(db: aiosqlite.Connection) -> None:
+    await db.execute('''CREATE TABLE IF NOT EXISTS current_online (
+                        user_id INTEGER, guild_id INTEGER, channel_id INTEGER, 
+                        channel_name TEXT, join_time TEXT, is_counting BOOLEAN)''')
+    await db.execute('''CREATE TABLE IF NOT EXISTS all_online (
+                        user_id INTEGER, guild_id INTEGER, channel_id INTEGER, 
+                        channel_name TEXT, date TEXT, seconds INTEGER, is_counting BOOLEAN,
+                        UNIQUE(user_id, guild_id, channel_id, date))''')
+
+
+async def _epoch_integers(db: aiosqlite.Connection) -> None:
+    # join_time: локальное 'YYYY-MM-DD HH:MM:SS' -> UTC epoch, date: 'YYYY-MM-DD' -> date.toordinal()
+    await db.execute('''CREATE TABLE current_online_new (
+                        user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, channel_id INTEGER NOT NULL,
+                        channel_name TEXT, join_time INTEGER NOT NULL, is_counting BOOLEAN NOT NULL,
+                        PRIMARY KEY (guild_id, user_id))''')
+    await db.execute('''INSERT OR REPLACE INTO current_online_new
+                        SELECT user_id, guild_id, channel_id, channel_name,
+                               CAST(strftime('%s', join_time, 'utc') AS INTEGER), is_counting
+                        FROM current_online ORDER BY join_time''')
+    await db.execute('''CREATE TABLE all_online_new (
+                        user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, channel_id INTEGER NOT NULL,
+                        channel_name TEXT, date INTEGER NOT NULL, seconds INTEGER NOT NULL, is_counting BOOLEAN NOT NULL,
+                        UNIQUE(user_id, guild_id, date, channel_id))''')
+    await db.execute('''INSERT INTO all_online_new
+                        SELECT user_id, guild_id, channel_id, channel_name,
+                               CAST(julianday(date) - 1721424.5 AS INTEGER), CAST(ROUND(seconds) AS INTEGER), is_counting
+                        FROM all_online WHERE true
+                        ON CONFLICT(user_id, guild_id, date, channel_id) DO UPDATE SET seconds = seconds + excluded.seconds''')
+    await db.execute('DROP TABLE current_online')
+    await db.execute('DROP TABLE all_online')
+    await db.execute('ALTER TABLE current_online_new RENAME TO current_online')
+    await db.execute('ALTER TABLE all_online_new RENAME TO all_online')
+    # get_top: диапазон дат внутри сервера, SUM(seconds) без обращения к таблице
+    await db.execute('''CREATE INDEX all_online_guild_date
+                        ON all_online (guild_id, date, user_id, is_counting, seconds)''')
+
+
+MONTHLY_ROLLUP = '''INSERT INTO online_monthly (month, guild_id, user_id, is_counting, seconds)
+                    SELECT CAST(strftime('%Y%m', date + 1721424.5) AS INTEGER) AS month,
+                           guild_id, user_id, is_counting, SUM(seconds)
+                    FROM all_online GROUP BY month, guild_id, user_id, is_counting'''
+
+
+async def _monthly_rollup(db: aiosqlite.Connection) -> None:
+    await db.execute('''CREATE TABLE online_monthly (
+                        month INTEGER NOT NULL, guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+                        is_counting BOOLEAN NOT NULL, seconds INTEGER NOT NULL,
+                        PRIMARY KEY (month, guild_id, user_id, is_counting))''')
+    await db.execute(MONTHLY_ROLLUP)
+
+
+
+async def _archive_log(db: aiosqlite.Connection) -> None:
+    await db.execute('''CREATE TABLE online_archive_log (
+                        month INTEGER NOT NULL, crc INTEGER NOT NULL, rows INTEGER NOT NULL,
+                        archived_at INTEGER NOT NULL)''')
+
+
+
+async def _channel_dimension(db: aiosqlite.Connection) -> None:
+    await db.execute('''CREATE TABLE channels (
+                        channel_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, name TEXT NOT NULL,
+                        is_counting BOOLEAN NOT NULL, updated_at INTEGER NOT NULL)''')
+    await db.execute('''CREATE TABLE channel_names (
+                        channel_id INTEGER NOT NULL, name TEXT NOT NULL, since INTEGER NOT NULL)''')
+    await db.execute('''CREATE INDEX channel_names_channel ON channel_names (channel_id, since)''')
+    # Текущее имя - из самой свежей строки; история - первое появление каждого имени
+    await db.execute('''INSERT INTO channel_names (channel_id, name, since)
+                        SELECT channel_id, channel_name, (MIN(date) - 719163) * 86400
+                        FROM all_online WHERE channel_name IS NOT NULL GROUP BY channel_id, channel_name''')
+    await db.execute('''INSERT OR REPLACE INTO channels (channel_id, guild_id, name, is_counting, updated_at)
+                        SELECT channel_id, guild_id, channel_name, is_counting, since FROM (
+                            SELECT channel_id, guild_id, channel_name, is_counting, (date - 719163) * 86400 AS since
+                            FROM all_online WHERE channel_name IS NOT NULL
+                            UNION ALL
+                            SELECT channel_id, guild_id, channel_name, is_counting, join_time
+                            FROM current_online WHERE channel_name IS NOT NULL
+                        ) ORDER BY since''')
+    await db.execute('ALTER TABLE current_online DROP COLUMN channel_name')
+    await db.execute('ALTER TABLE all_online DROP COLUMN channel_name')
+
+
+
+async def _session_log(db: aiosqlite.Connection) -> None:
+    await db.execute('''CREATE TABLE online_sessions (
+                        user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, channel_id INTEGER NOT NULL,
+                        started_at INTEGER NOT NULL, ended_at INTEGER NOT NULL, is_counting BOOLEAN NOT NULL)''')
+    await db.execute('''CREATE INDEX online_sessions_guild_end ON online_sessions (guild_id, ended_at)''')
+
+
+
+async def _classification_log(db: aiosqlite.Connection) -> None:
+    await db.execute('''CREATE TABLE channel_classifications (
+                        channel_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, is_counting BOOLEAN NOT NULL,
+                        reason TEXT, changed_at INTEGER NOT NULL)''')
+    await db.execute('''CREATE INDEX channel_classifications_guild ON channel_classifications (guild_id, changed_at)''')
+
+
+async def _checkpoints(db: aiosqlite.Connection) -> None:
+    # credited_until: до какого момента открытая сессия уже начислена в all_online
+    await db.execute('ALTER TABLE current_online ADD COLUMN credited_until INTEGER')
+    # Открытые до миграции сессии начисляются по момент миграции: при старте они закрываются на credited_until
+    now = int(time.time())
+    cursor = await db.execute('SELECT user_id, guild_id, channel_id, join_time, is_counting FROM current_online')
+    days, months = [], {}
+    for user_id, guild_id, channel_id, join_time, is_counting in await cursor.fetchall():
+        for day, seconds in _split_by_days(join_time, now).items():
+            days.append((user_id, guild_id, channel_id, day, seconds, is_counting))
+            date = datetime.date.fromordinal(day)
+            key = (date.year * 100 + date.month, guild_id, user_id, is_counting)
+            months[key] = months.get(key, 0) + seconds
+    await db.executemany('''INSERT INTO all_online (user_id, guild_id, channel_id, date, seconds, is_counting)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(user_id, guild_id, date, channel_id)
+                            DO UPDATE SET seconds = seconds + excluded.seconds''', days)
+    await db.executemany('''INSERT INTO online_monthly (month, guild_id, user_id, is_counting, seconds)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(month, guild_id, user_id, is_counting)
+                            DO UPDATE SET seconds = seconds + excluded.seconds''',
+                         [key + (seconds,) for key, seconds in months.items()])
+    await db.execute('UPDATE current_online SET credited_until = MAX(join_time, ?)', (now,))
+
+
+MIGRATIONS = [_baseline, _epoch_integers, _monthly_rollup, _archive_log, _channel_dimension, _session_log,
+              _classification_log, _checkpoints]
+
+
+async def schema_version(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute('PRAGMA user_version')
+    (version,) = await cursor.fetchone()
+    return version
+
+
+async def migrate(db: aiosqlite.Connection) -> int:
+    version = await schema_version(db)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        await db.execute('BEGIN')
+        try:
+            await migration(db)
+            await db.execute(f'PRAGMA user_version = {number}')
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    return len(MIGRATIONS)
+
+
+async def convert(path: str) -> None:
+    async with aiosqlite.connect(path) as db:
+        before = await schema_version(db)
+        after = await migrate(db)
+        await db.execute('VACUUM')
+    print(f'{path}: schema v{before} -> v{after}')
+
+
+if __name__ == '__main__':
+    # Разовая конвертация существующей базы: python database/online/migrations.py online.sqlite
+    asyncio.run(convert(sys.argv[1] if len(sys.argv) > 1 else 'online.sqlite'))
@@ -0,0 +1,70 @@
+import asyncio
+import collections
+import contextlib
+import pathlib
+import time
+from dataclasses import dataclass
+
+import aiosqlite
+
+
+@dataclass
+class PoolStats:
+    size: int
+    in_use: int
+    acquisitions: int
+    average_wait: float
+    p95_wait: float
+    max_wait: float
+
+
+class ReadPool:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._connections: list[aiosqlite.Connection] = []
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._waits: collections.deque[float] = collections.deque(maxlen=1000)
+        self._acquisitions = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def open(self) -> None:
+        uri = pathlib.Path(self.path).resolve().as_uri() + '?mode=ro'
+        for _ in range(self.size):
+            connection = await aiosqlite.connect(uri, uri=True)
+            self._connections.append(connection)
+            self._idle.put_nowait(connection)
+
+    async def close(self) -> None:
+        for connection in self._connections:
+            await connection.close()
+        self._connections.clear()
+        self._idle = asyncio.Queue()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        connection = await self._idle.get()
+        self._record_wait(time.perf_counter() - started)
+        try:
+            yield connection
+        finally:
+            self._idle.put_nowait(connection)
+
+    def _record_wait(self, wait: float) -> None:
+        self._acquisitions += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        self._waits.append(wait)
+
+    def stats(self) -> PoolStats:
+        waits = sorted(self._waits)
+        return PoolStats(
+            size=len(self._connections),
+            in_use=len(self._connections) - self._idle.qsize(),
+            acquisitions=self._acquisitions,
+            average_wait=self._total_wait / self._acquisitions if self._acquisitions else 0.0,
+            p95_wait=waits[int(len(waits) * 0.95)] if waits else 0.0,
+            max_wait=self._max_wait
+        )
@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+from typing import Callable
+
+import discord
+
+from database.online.features import is_counting
+
+
+type LiveSessions = dict[tuple[int, int], tuple[discord.VoiceChannel | discord.StageChannel, bool]]
+
+
+@dataclass
+class ReconcileReport:
+    opened: int
+    closed: int
+    elapsed: float
+
+    @property
+    def corrected(self) -> int:
+        return self.opened + self.closed
+
+    def __str__(self) -> str:
+        return f'{self.corrected} sessions corrected ({self.opened} opened, {self.closed} closed) in {self.elapsed * 1000:.1f}ms'
+
+
+def live_sessions(guilds: list[discord.Guild], classify: Callable[[discord.VoiceChannel | discord.StageChannel], bool] = is_counting) -> LiveSessions:
+    live = {}
+    for guild in guilds:
+        for channel in (*guild.voice_channels, *guild.stage_channels):
+            members = [member for member in channel.members if not (member.voice and member.voice.self_deaf)]
+            if not members:
+                continue
+            counting = classify(channel)
+            for member in members:
+                live[(guild.id, member.id)] = (channel, counting)
+    return live
@@ -0,0 +1,17 @@
+from motor.motor_asyncio import AsyncIOMotorClient as MotorClient
+
+from database.online.storage.base import DUMP_KINDS, OnlineStorage
+from database.online.storage.mongo import MongoStorage
+from database.online.storage.sqlite import SqliteStorage
+
+BACKENDS = ('sqlite', 'mongo')
+
+
+def create_storage(backend: str, db_path: str, client: MotorClient | None) -> OnlineStorage:
+    if backend == 'sqlite':
+        return SqliteStorage(db_path)
+    if backend == 'mongo':
+        if client is None:
+            raise ValueError("Mongo backend requires a Mongo client")
+        return MongoStorage(client)
+    raise ValueError(f"Unknown online storage backend: {backend}")
@@ -0,0 +1,73 @@
+import abc
+from typing import AsyncIterator
+
+from database.online.channels import Channel
+from database.online.events import OnlineEvent
+from database.online.maintenance import Exclusive, MaintenanceStep
+from database.online.pool import PoolStats
+
+# Строки, которыми обмениваются OnlineDatabase, хранилища и перенос между ними:
+#   current:         user_id, guild_id, channel_id, join_time, is_counting, credited_until
+#   online:          user_id, guild_id, channel_id, channel_name | None, date, seconds, is_counting
+#   sessions:        user_id, guild_id, channel_id, started_at, ended_at, is_counting
+#   channels:        channel_id, guild_id, name, is_counting, updated_at
+#   channel_names:   channel_id, name, since
+#   classifications: channel_id, guild_id, is_counting, reason, changed_at
+DUMP_KINDS = ('channels', 'channel_names', 'classifications', 'current', 'online', 'sessions')
+
+
+class OnlineStorage(abc.ABC):
+    name: str
+
+    @abc.abstractmethod
+    async def open(self) -> None: ...
+
+    @abc.abstractmethod
+    async def close(self) -> None: ...
+
+    @abc.abstractmethod
+    async def load_current(self) -> list[tuple]: ...
+
+    @abc.abstractmethod
+    async def load_channels(self) -> list[Channel]: ...
+
+    @abc.abstractmethod
+    async def empty(self) -> bool: ...
+
+    @abc.abstractmethod
+    async def apply(self, events: list[OnlineEvent]) -> None: ...
+
+    @abc.abstractmethod
+    async def select_online(self, user_ids: set[int], guild_id: int, day_from: int | None, day_to: int | None,
+                            is_open: bool) -> list[tuple]: ...
+
+    @abc.abstractmethod
+    async def day_totals(self, day_from: int, day_to: int) -> list[tuple[int, int, int, int]]: ...
+
+    @abc.abstractmethod
+    async def top(self, month: int, is_open: bool, guild_id: int | None) -> dict[int, int]: ...
+
+    @abc.abstractmethod
+    async def sessions(self, guild_id: int, start: int, end: int, is_open: bool, user_id: int | None) -> list[tuple]: ...
+
+    @abc.abstractmethod
+    async def classification_log(self, guild_id: int, limit: int) -> list[tuple[int, bool, str, int]]: ...
+
+    @abc.abstractmethod
+    async def rebuild_monthly(self) -> int: ...
+
+    @abc.abstractmethod
+    def dump(self) -> AsyncIterator[tuple[str, list[tuple]]]: ...
+
+    @abc.abstractmethod
+    async def load(self, kind: str, rows: list[tuple]) -> None: ...
+
+    async def archive_closed_months(self, hot_start: int) -> dict[int, int]:
+        return {}
+
+    async def maintain(self, exclusive: Exclusive, full_analyze: bool = False,
+                       convert_vacuum: bool = False) -> list[MaintenanceStep]:
+        return []
+
+    def stats(self) -> PoolStats | None:
+        return None
@@ -0,0 +1,301 @@
+import hashlib
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient as MotorClient, AsyncIOMotorClientSession as MotorSession
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import config
+
+from database.online.channels import Channel
+from database.online.events import ChannelEvent, CheckpointEvent, CreditEvent, OnlineEvent
+from database.online.features import split_by_days, to_month
+from database.online.storage.base import OnlineStorage
+
+
+class MongoStorage(OnlineStorage):
+    name = 'mongo'
+
+    def __init__(self, client: MotorClient):
+        self._client = client
+        self._db = self._client['Online']
+        self.current = self._db['current']
+        self.days = self._db['days']
+        self.monthly = self._db['monthly']
+        self.sessions_log = self._db['sessions']
+        self.channels = self._db['channels']
+        self.classifications = self._db['classifications']
+        self.transactions = False
+
+    async def open(self) -> None:
+        if config.mongo_transactions:
+            self.transactions = 'setName' in await self._client.admin.command('hello')
+            if not self.transactions:
+                logging.info('MongoDB is not a replica set, voice events are written idempotently without transactions')
+        await self.current.create_index([('guild_id', 1), ('user_id', 1)], unique=True)
+        await self._regroup_days()
+        await self.days.create_index([('guild_id', 1), ('user_id', 1), ('date', 1)], unique=True)
+        await self.days.create_index([('guild_id', 1), ('date', 1)])
+        await self.monthly.create_index([('month', 1), ('guild_id', 1), ('user_id', 1), ('is_counting', 1)], unique=True)
+        await self.sessions_log.create_index([('guild_id', 1), ('ended_at', 1)])
+        await self.sessions_log.create_index([('guild_id', 1), ('user_id', 1), ('started_at', 1)])
+        await self.classifications.create_index([('guild_id', 1), ('changed_at', -1)])
+
+    async def _regroup_days(self) -> None:
+        # Раньше на каждый канал за день был отдельный документ, теперь каналы лежат внутри документа дня
+        if 'guild_id_1_user_id_1_date_1_channel_id_1' in await self.days.index_information():
+            await self.days.drop_index('guild_id_1_user_id_1_date_1_channel_id_1')
+        updates, stale = [], []
+        async for doc in self.days.find({'channel_id': {'$exists': True}}):
+            updates.append(UpdateOne(
+                {'guild_id': doc['guild_id'], 'user_id': doc['user_id'], 'date': doc['date'], 'channel_id': {'$exists': False}},
+                {'$inc': {f"channels.{doc['channel_id']}.seconds": doc['seconds']},
+                 '$set': {f"channels.{doc['channel_id']}.is_counting": doc['is_counting']},
+                 '$setOnInsert': {'month': doc['month']}}, upsert=True
+            ))
+            stale.append(doc['_id'])
+        if updates:
+            await self.days.bulk_write(updates, ordered=True)
+            await self.days.delete_many({'_id': {'$in': stale}})
+
+    async def close(self) -> None:
+        pass
+
+    async def load_current(self) -> list[tuple]:
+        return [(doc['user_id'], doc['guild_id'], doc['channel_id'], doc['join_time'], doc['is_counting'],
+                 doc['credited_until']) async for doc in self.current.find({}, {'_id': 0})]
+
+    async def load_channels(self) -> list[Channel]:
+        return [Channel(doc['_id'], doc['guild_id'], doc['name'], doc['is_counting'])
+                async for doc in self.channels.find({}, {'names': 0})]
+
+    async def empty(self) -> bool:
+        for collection in (self.days, self.sessions_log, self.channels):
+            if await collection.find_one({}, {'_id': 1}) is not None:
+                return False
+        return True
+
+    async def apply(self, events: list[OnlineEvent]) -> None:
+        if self.transactions:
+            async with await self._client.start_session() as session:
+                await session.with_transaction(lambda s: self._apply(events, s))
+            return
+        # Без транзакций повтор пачки после частичной записи не должен начислить время дважды:
+        # счётчики помнят последнюю пачку, остальные записи идут через upsert по естественному ключу
+        await self._apply(events, batch=hashlib.blake2b(repr(events).encode(), digest_size=12).hexdigest())
+
+    async def _apply(self, events: list[OnlineEvent], session: MotorSession = None, batch: str = None) -> None:
+        current, sessions, buckets = [], [], {}
+        for event in events:
+            if event.kind == 'join':
+                current.append(ReplaceOne(
+                    {'guild_id': event.guild_id, 'user_id': event.user_id},
+                    {'guild_id': event.guild_id, 'user_id': event.user_id, 'channel_id': event.channel_id,
+                     'join_time': event.join_time, 'is_counting': bool(event.is_counting),
+                     'credited_until': event.credited_until}, upsert=True
+                ))
+            elif event.kind == 'close':
+                current.append(DeleteOne({'guild_id': event.guild_id, 'user_id': event.user_id}))
+            elif event.kind == 'credit':
+                sessions += self._credit(event, buckets)
+            elif event.kind == 'checkpoint':
+                current += self._checkpoint(event, buckets)
+            else:
+                await self._upsert_channel(event, session)
+
+        if current:
+            await self.current.bulk_write(current, ordered=True, session=session)
+        if sessions:
+            await self.sessions_log.bulk_write([ReplaceOne(
+                {key: doc[key] for key in ('guild_id', 'user_id', 'started_at', 'channel_id', 'ended_at')}, doc, upsert=True
+            ) for doc in sessions], ordered=False, session=session)
+        await self._add_buckets([key + value for key, value in buckets.items()], session, batch)
+
+    @staticmethod
+    def _credit(event: CreditEvent, buckets: dict) -> list[dict]:
+        for channel_id, _, credited_until, end, is_counting in event.segments:
+            for day, seconds in split_by_days(credited_until, end).items():
+                key = (event.user_id, event.guild_id, channel_id, day)
+                buckets[key] = (buckets.get(key, (0,))[0] + seconds, is_counting)
+        return [{'user_id': event.user_id, 'guild_id': event.guild_id, 'channel_id': channel_id,
+                 'started_at': start, 'ended_at': end, 'is_counting': bool(is_counting)}
+                for channel_id, start, _, end, is_counting in event.segments]
+
+    @staticmethod
+    def _checkpoint(event: CheckpointEvent, buckets: dict) -> list[UpdateOne]:
+        for user_id, guild_id, channel_id, credited_until, is_counting in event.sessions:
+            for day, seconds in split_by_days(credited_until, event.at).items():
+                key = (user_id, guild_id, channel_id, day)
+                buckets[key] = (buckets.get(key, (0,))[0] + seconds, is_counting)
+        return [UpdateOne({'guild_id': guild_id, 'user_id': user_id}, {'$set': {'credited_until': event.at}})
+                for user_id, guild_id, *_ in event.sessions]
+
+    async def _add_buckets(self, rows: list[tuple], session: MotorSession = None, batch: str = None) -> None:
+        if not rows:
+            return
+        days, months = {}, {}
+        for user_id, guild_id, channel_id, day, seconds, is_counting in rows:
+            update = days.setdefault((guild_id, user_id, day), {'$inc': {}, '$set': {}})
+            update['$inc'][f'channels.{channel_id}.seconds'] = update['$inc'].get(f'channels.{channel_id}.seconds', 0) + seconds
+            update['$set'][f'channels.{channel_id}.is_counting'] = bool(is_counting)
+            key = (to_month(day), guild_id, user_id, bool(is_counting))
+            months[key] = months.get(key, 0) + seconds
+        await self._increment(self.days, [(
+            {'guild_id': guild_id, 'user_id': user_id, 'date': day},
+            update | {'$setOnInsert': {'month': to_month(day)}}
+        ) for (guild_id, user_id, day), update in days.items()], session, batch)
+        await self._increment(self.monthly, [(
+            {'month': month, 'guild_id': guild_id, 'user_id': user_id, 'is_counting': is_counting},
+            {'$inc': {'seconds': seconds}}
+        ) for (month, guild_id, user_id, is_counting), seconds in months.items()], session, batch)
+
+    @staticmethod
+    async def _increment(collection, updates: list[tuple[dict, dict]], session: MotorSession, batch: str | None) -> None:
+        if batch is None:
+            await collection.bulk_write([UpdateOne(key, update, upsert=True) for key, update in updates],
+                                        ordered=False, session=session)
+            return
+        # Документ, уже получивший эту пачку, не совпадает с фильтром, а upsert упирается в уникальный индекс
+        try:
+            await collection.bulk_write([UpdateOne(
+                key | {'batch': {'$ne': batch}}, update | {'$set': update.get('$set', {}) | {'batch': batch}}, upsert=True
+            ) for key, update in updates], ordered=False)
+        except BulkWriteError as error:
+            if any(item['code'] != 11000 for item in error.details['writeErrors']) or error.details['writeConcernErrors']:
+                raise
+
+    async def _upsert_channel(self, event: ChannelEvent, session: MotorSession = None) -> None:
+        previous = await self.channels.find_one({'_id': event.channel_id}, {'name': 1, 'is_counting': 1}, session=session)
+        if event.reason == 'delete' or previous is None or previous['is_counting'] != event.is_counting:
+            await self.classifications.update_one(
+                {'guild_id': event.guild_id, 'changed_at': event.at, 'channel_id': event.channel_id, 'reason': event.reason},
+                {'$set': {'is_counting': event.is_counting}}, upsert=True, session=session
+            )
+        update = {'$set': {'guild_id': event.guild_id, 'name': event.name, 'is_counting': event.is_counting,
+                           'updated_at': event.at}}
+        if previous is None or previous['name'] != event.name:
+            update['$push'] = {'names': {'name': event.name, 'since': event.at}}
+        await self.channels.update_one({'_id': event.channel_id}, update, upsert=True, session=session)
+
+    async def select_online(self, user_ids: set[int], guild_id: int, day_from: int | None, day_to: int | None,
+                            is_open: bool) -> list[tuple]:
+        query = {'guild_id': guild_id, 'user_id': {'$in': list(user_ids)}}
+        if day_from is not None:
+            query['date'] = {'$gte': day_from, '$lte': day_to}
+        return [row async for doc in self.days.find(query, {'_id': 0, 'month': 0})
+                for row in self._day_rows(doc) if row[6] or not is_open]
+
+    async def day_totals(self, day_from: int, day_to: int) -> list[tuple[int, int, int, int]]:
+        pipeline = [
+            {'$match': {'date': {'$gte': day_from, '$lte': day_to}}},
+            {'$project': {'_id': 0, 'guild_id': 1, 'user_id': 1, 'date': 1, 'seconds': {'$sum': {'$map': {
+                'input': {'$filter': {'input': {'$objectToArray': '$channels'}, 'cond': '$$this.v.is_counting'}},
+                'in': '$$this.v.seconds'
+            }}}}},
+            {'$match': {'seconds': {'$gt': 0}}},
+        ]
+        return [(doc['guild_id'], doc['user_id'], doc['date'], doc['seconds'])
+                async for doc in self.days.aggregate(pipeline)]
+
+    @staticmethod
+    def _day_rows(doc: dict) -> list[tuple]:
+        return [(doc['user_id'], doc['guild_id'], int(channel_id), None, doc['date'], channel['seconds'], channel['is_counting'])
+                for channel_id, channel in doc['channels'].items()]
+
+    async def top(self, month: int, is_open: bool, guild_id: int | None) -> dict[int, int]:
+        match = {'month': month}
+        if guild_id:
+            match['guild_id'] = guild_id
+        if is_open:
+            match['is_counting'] = True
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': '$user_id', 'total_seconds': {'$sum': '$seconds'}}},
+            {'$sort': {'total_seconds': -1}},
+            {'$limit': 20},
+        ]
+        return {doc['_id']: doc['total_seconds'] async for doc in self.monthly.aggregate(pipeline)}
+
+    async def sessions(self, guild_id: int, start: int, end: int, is_open: bool, user_id: int | None) -> list[tuple]:
+        query = {'guild_id': guild_id, 'ended_at': {'$gt': start}, 'started_at': {'$lt': end}}
+        if user_id:
+            query['user_id'] = user_id
+        if is_open:
+            query['is_counting'] = True
+        return [(doc['user_id'], doc['channel_id'], doc['started_at'], doc['ended_at'])
+                async for doc in self.sessions_log.find(query, {'_id': 0})]
+
+    async def classification_log(self, guild_id: int, limit: int) -> list[tuple[int, bool, str, int]]:
+        cursor = self.classifications.find({'guild_id': guild_id}).sort([('changed_at', -1), ('_id', -1)]).limit(limit)
+        return [(doc['channel_id'], doc['is_counting'], doc['reason'], doc['changed_at']) async for doc in cursor]
+
+    async def rebuild_monthly(self) -> int:
+        await self.days.aggregate([
+            {'$project': {'month': 1, 'guild_id': 1, 'user_id': 1, 'channels': {'$objectToArray': '$channels'}}},
+            {'$unwind': '$channels'},
+            {'$group': {'_id': {'month': '$month', 'guild_id': '$guild_id', 'user_id': '$user_id',
+                                'is_counting': '$channels.v.is_counting'},
+                        'seconds': {'$sum': '$channels.v.seconds'}}},
+            {'$project': {'_id': 0, 'month': '$_id.month', 'guild_id': '$_id.guild_id', 'user_id': '$_id.user_id',
+                          'is_counting': '$_id.is_counting', 'seconds': 1}},
+            {'$out': self.monthly.name},
+        ]).to_list(None)
+        return await self.monthly.count_documents({})
+
+    async def dump(self):
+        shapes = {
+            'channels': (self.channels, lambda doc: (doc['_id'], doc['guild_id'], doc['name'], doc['is_counting'], doc['updated_at'])),
+            'classifications': (self.classifications, lambda doc: (doc['channel_id'], doc['guild_id'], doc['is_counting'],
+                                                                   doc['reason'], doc['changed_at'])),
+            'current': (self.current, lambda doc: (doc['user_id'], doc['guild_id'], doc['channel_id'], doc['join_time'],
+                                                   doc['is_counting'], doc['credited_until'])),
+            'online': (self.days, self._day_rows),
+            'sessions': (self.sessions_log, lambda doc: (doc['user_id'], doc['guild_id'], doc['channel_id'], doc['started_at'],
+                                                         doc['ended_at'], doc['is_counting'])),
+        }
+        for kind, (collection, shape) in shapes.items():
+            if kind == 'classifications':
+                names = [(doc['_id'], name['name'], name['since'])
+                         async for doc in self.channels.find({}, {'names': 1}) for name in doc.get('names', [])]
+                for offset in range(0, len(names), 5000):
+                    yield 'channel_names', names[offset:offset + 5000]
+            rows = []
+            async for doc in collection.find({}):
+                rows += shape(doc) if kind == 'online' else [shape(doc)]
+                if len(rows) >= 5000:
+                    yield kind, rows
+                    rows = []
+            if rows:
+                yield kind, rows
+
+    async def load(self, kind: str, rows: list[tuple]) -> None:
+        if kind == 'channels':
+            await self.channels.bulk_write([UpdateOne(
+                {'_id': channel_id},
+                {'$set': {'guild_id': guild_id, 'name': name, 'is_counting': bool(is_counting), 'updated_at': updated_at}},
+                upsert=True
+            ) for channel_id, guild_id, name, is_counting, updated_at in rows], ordered=False)
+        elif kind == 'channel_names':
+            await self.channels.bulk_write([UpdateOne(
+                {'_id': channel_id}, {'$push': {'names': {'name': name, 'since': since}}}, upsert=True
+            ) for channel_id, name, since in rows], ordered=True)
+        elif kind == 'classifications':
+            await self.classifications.bulk_write([InsertOne(
+                {'channel_id': channel_id, 'guild_id': guild_id, 'is_counting': bool(is_counting), 'reason': reason,
+                 'changed_at': changed_at}
+            ) for channel_id, guild_id, is_counting, reason, changed_at in rows], ordered=True)
+        elif kind == 'current':
+            await self.current.bulk_write([ReplaceOne(
+                {'guild_id': guild_id, 'user_id': user_id},
+                {'guild_id': guild_id, 'user_id': user_id, 'channel_id': channel_id, 'join_time': join_time,
+                 'is_counting': bool(is_counting), 'credited_until': credited_until}, upsert=True
+            ) for user_id, guild_id, channel_id, join_time, is_counting, credited_until in rows], ordered=False)
+        elif kind == 'online':
+            await self._add_buckets([(user_id, guild_id, channel_id, date, seconds, is_counting)
+                                     for user_id, guild_id, channel_id, _, date, seconds, is_counting in rows])
+        elif kind == 'sessions':
+            await self.sessions_log.insert_many([
+                {'user_id': user_id, 'guild_id': guild_id, 'channel_id': channel_id, 'started_at': started_at,
+                 'ended_at': ended_at, 'is_counting': bool(is_counting)}
+                for user_id, guild_id, channel_id, started_at, ended_at, is_counting in rows
+            ], ordered=False)
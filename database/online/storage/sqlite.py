@@ -0,0 +1,297 @@
+import json
+import time
+
+import aiosqlite
+
+import config
+from database.online import maintenance
+from database.online.archive import OnlineArchive
+from database.online.channels import Channel
+from database.online.events import ChannelEvent, CheckpointEvent, CreditEvent, OnlineEvent, VoiceEvent
+from database.online.features import month_bounds, months_between, split_by_days, to_month
+from database.online.maintenance import Exclusive, MaintenanceStep
+from database.online.migrations import MONTHLY_ROLLUP, migrate
+from database.online.pool import PoolStats, ReadPool
+from database.online.storage.base import OnlineStorage
+
+
+class SqliteStorage(OnlineStorage):
+    name = 'sqlite'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.db = None  # Инициализируем переменную для хранения соединения
+        self.reads = ReadPool(db_path, config.online_read_pool_size)
+        self.archive = OnlineArchive(config.online_archive_path)
+
+    async def open(self) -> None:
+        self.db = await aiosqlite.connect(self.db_path)  # Устанавливаем соединение
+        # Действует только на новый файл, до первой записанной страницы (и до перехода в WAL); существующий файл
+        # переводится полным VACUUM через /online-admin maintenance
+        await self.db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        await self.db.execute('PRAGMA journal_mode = WAL')
+        await self.db.execute('PRAGMA synchronous = NORMAL')
+        await migrate(self.db)
+        await self.reads.open()
+        self.archive.open()
+        cursor = await self.db.execute("SELECT month, crc FROM online_archive_log ORDER BY rowid")
+        self.archive.recover({month: crc for month, crc in await cursor.fetchall()})
+
+    async def close(self) -> None:
+        await self.reads.close()
+        if self.db is not None:
+            await self.db.close()  # Закрываем соединение
+            self.db = None
+
+    async def maintain(self, exclusive: Exclusive, full_analyze: bool = False,
+                       convert_vacuum: bool = False) -> list[MaintenanceStep]:
+        return await maintenance.run(
+            self.db, self.reads, exclusive, backup_path=config.online_backup_path, backup_keep=config.online_backup_keep,
+            vacuum_pages=config.online_vacuum_pages, full_analyze=full_analyze, convert_vacuum=convert_vacuum
+        )
+
+    def stats(self) -> PoolStats:
+        return self.reads.stats()
+
+    async def load_current(self) -> list[tuple]:
+        cursor = await self.db.execute("SELECT user_id, guild_id, channel_id, join_time, is_counting, credited_until FROM current_online")
+        return list(await cursor.fetchall())
+
+    async def load_channels(self) -> list[Channel]:
+        cursor = await self.db.execute("SELECT channel_id, guild_id, name, is_counting FROM channels")
+        return [Channel(row[0], row[1], row[2], bool(row[3])) for row in await cursor.fetchall()]
+
+    async def empty(self) -> bool:
+        for table in ('all_online', 'online_sessions', 'channels'):
+            cursor = await self.db.execute(f"SELECT 1 FROM {table} LIMIT 1")
+            if await cursor.fetchone() is not None:
+                return False
+        return not self.archive.months
+
+    async def apply(self, events: list[OnlineEvent]) -> None:
+        try:
+            for event in events:
+                if event.kind == 'join':
+                    await self._insert_join(event)
+                elif event.kind == 'close':
+                    await self._delete_current(event)
+                elif event.kind == 'credit':
+                    await self._credit(event)
+                elif event.kind == 'checkpoint':
+                    await self._checkpoint(event)
+                else:
+                    await self._upsert_channel(event)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+    async def _insert_join(self, event: VoiceEvent) -> None:
+        await self.db.execute('''INSERT OR REPLACE INTO current_online (user_id, guild_id, channel_id,
+                            join_time, is_counting, credited_until) VALUES (?, ?, ?, ?, ?, ?)''',
+                              (event.user_id, event.guild_id, event.channel_id, event.join_time, event.is_counting,
+                               event.credited_until))
+
+    async def _upsert_channel(self, event: ChannelEvent) -> None:
+        await self.db.execute('''INSERT INTO channel_classifications (channel_id, guild_id, is_counting, reason, changed_at)
+                            SELECT ?, ?, ?, ?, ? WHERE ? = 'delete' OR NOT EXISTS
+                            (SELECT 1 FROM channels WHERE channel_id = ? AND is_counting = ?)''',
+                              (event.channel_id, event.guild_id, event.is_counting, event.reason, event.at,
+                               event.reason, event.channel_id, event.is_counting))
+        await self.db.execute('''INSERT INTO channel_names (channel_id, name, since) SELECT ?, ?, ?
+                            WHERE NOT EXISTS (SELECT 1 FROM channels WHERE channel_id = ? AND name = ?)''',
+                              (event.channel_id, event.name, event.at, event.channel_id, event.name))
+        await self.db.execute('''INSERT INTO channels (channel_id, guild_id, name, is_counting, updated_at)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(channel_id) DO UPDATE SET guild_id = excluded.guild_id, name = excluded.name,
+                            is_counting = excluded.is_counting, updated_at = excluded.updated_at''',
+                              (event.channel_id, event.guild_id, event.name, event.is_counting, event.at))
+
+    async def _delete_current(self, event: VoiceEvent) -> None:
+        await self.db.execute("DELETE FROM current_online WHERE user_id = ? AND guild_id = ?",
+                              (event.user_id, event.guild_id))
+
+    async def _credit(self, event: CreditEvent) -> None:
+        await self.db.executemany('''INSERT INTO online_sessions (user_id, guild_id, channel_id, started_at, ended_at, is_counting)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                                  [(event.user_id, event.guild_id, channel_id, start, end, is_counting)
+                                   for channel_id, start, _, end, is_counting in event.segments])
+
+        buckets = {}
+        for channel_id, _, credited_until, end, is_counting in event.segments:
+            for day, seconds in split_by_days(credited_until, end).items():
+                buckets[(channel_id, day)] = (buckets.get((channel_id, day), (0,))[0] + seconds, is_counting)
+        await self._add_buckets([(event.user_id, event.guild_id, channel_id, day, seconds, is_counting)
+                                 for (channel_id, day), (seconds, is_counting) in buckets.items()])
+
+    async def _checkpoint(self, event: CheckpointEvent) -> None:
+        rows = []
+        for user_id, guild_id, channel_id, credited_until, is_counting in event.sessions:
+            rows += [(user_id, guild_id, channel_id, day, seconds, is_counting)
+                     for day, seconds in split_by_days(credited_until, event.at).items()]
+        await self._add_buckets(rows)
+        await self.db.executemany("UPDATE current_online SET credited_until = ? WHERE guild_id = ? AND user_id = ?",
+                                  [(event.at, guild_id, user_id) for user_id, guild_id, *_ in event.sessions])
+
+    async def _add_buckets(self, rows: list[tuple]) -> None:
+        await self.db.executemany('''INSERT INTO all_online (user_id, guild_id, channel_id, date,
+                            seconds, is_counting)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(user_id, guild_id, date, channel_id)
+                            DO UPDATE SET seconds = seconds + excluded.seconds, is_counting = excluded.is_counting''', rows)
+
+        months = {}
+        for user_id, guild_id, _, day, seconds, is_counting in rows:
+            key = (to_month(day), guild_id, user_id, is_counting)
+            months[key] = months.get(key, 0) + seconds
+        await self.db.executemany('''INSERT INTO online_monthly (month, guild_id, user_id, is_counting, seconds)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(month, guild_id, user_id, is_counting)
+                            DO UPDATE SET seconds = seconds + excluded.seconds''',
+                                  [key + (seconds,) for key, seconds in months.items()])
+
+    async def select_online(self, user_ids: set[int], guild_id: int, day_from: int | None, day_to: int | None,
+                            is_open: bool) -> list[tuple]:
+        query = """SELECT user_id, guild_id, channel_id, NULL, date, seconds, is_counting FROM all_online
+                   WHERE guild_id = ? AND user_id IN (SELECT value FROM json_each(?))"""
+        params = [guild_id, json.dumps(list(user_ids))]
+        if day_from is not None:
+            query += " AND date BETWEEN ? AND ?"
+            params += [day_from, day_to]
+        if is_open:
+            query += " AND is_counting = ?"
+            params.append(is_open)
+
+        async with self.reads.acquire() as connection:
+            cursor = await connection.execute(query, params)
+            rows = await cursor.fetchall()
+
+        months = self.archive.months if day_from is None else months_between(day_from, day_to)
+        if months & self.archive.months:
+            merged = {}
+            for row in await self.archive.select(months, guild_id, user_ids, day_from, day_to, is_open) + rows:
+                key = (row[0], row[2], row[4])
+                merged[key] = (row[:5] + (merged[key][5] + row[5],) + row[6:]) if key in merged else row
+            rows = list(merged.values())
+        return rows
+
+    async def day_totals(self, day_from: int, day_to: int) -> list[tuple[int, int, int, int]]:
+        async with self.reads.acquire() as connection:
+            cursor = await connection.execute('''SELECT guild_id, user_id, date, SUM(seconds) FROM all_online
+                                                 WHERE date BETWEEN ? AND ? AND is_counting GROUP BY guild_id, user_id, date''',
+                                              (day_from, day_to))
+            return list(await cursor.fetchall())
+
+    async def top(self, month: int, is_open: bool, guild_id: int | None) -> dict[int, int]:
+        query = "SELECT user_id, SUM(seconds) as total_seconds FROM online_monthly WHERE month = ?"
+        params = [month]
+
+        if guild_id:
+            query += " AND guild_id = ?"
+            params.append(guild_id)
+        if is_open:
+            query += " AND is_counting = ?"
+            params.append(is_open)
+        query += " GROUP BY user_id ORDER BY total_seconds DESC LIMIT 20"
+
+        async with self.reads.acquire() as connection:
+            cursor = await connection.execute(query, params)
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def sessions(self, guild_id: int, start: int, end: int, is_open: bool, user_id: int | None) -> list[tuple]:
+        query = """SELECT user_id, channel_id, started_at, ended_at FROM online_sessions
+                   WHERE guild_id = ? AND ended_at > ? AND started_at < ?"""
+        params = [guild_id, start, end]
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if is_open:
+            query += " AND is_counting = ?"
+            params.append(is_open)
+        async with self.reads.acquire() as connection:
+            cursor = await connection.execute(query, params)
+            return list(await cursor.fetchall())
+
+    async def classification_log(self, guild_id: int, limit: int) -> list[tuple[int, bool, str, int]]:
+        async with self.reads.acquire() as connection:
+            cursor = await connection.execute('''SELECT channel_id, is_counting, reason, changed_at FROM channel_classifications
+                                                 WHERE guild_id = ? ORDER BY changed_at DESC, rowid DESC LIMIT ?''', (guild_id, limit))
+            return [(row[0], bool(row[1]), row[2], row[3]) for row in await cursor.fetchall()]
+
+    async def rebuild_monthly(self) -> int:
+        try:
+            await self.db.execute("DELETE FROM online_monthly")
+            cursor = await self.db.execute(MONTHLY_ROLLUP)
+            rows = cursor.rowcount
+            for month in sorted(self.archive.months):
+                totals = await self.archive.totals(month)
+                await self.db.executemany('''INSERT INTO online_monthly (month, guild_id, user_id, is_counting, seconds)
+                                VALUES (?, ?, ?, ?, ?)
+                                ON CONFLICT(month, guild_id, user_id, is_counting)
+                                DO UPDATE SET seconds = seconds + excluded.seconds''', totals)
+                rows += len(totals)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        return rows
+
+    async def archive_closed_months(self, hot_start: int) -> dict[int, int]:
+        archived = {}
+        cursor = await self.db.execute("""SELECT DISTINCT CAST(strftime('%Y%m', date + 1721424.5) AS INTEGER)
+                                          FROM all_online WHERE date < ?""", (hot_start,))
+        for (month,) in await cursor.fetchall():
+            first, last = month_bounds(month)
+            cursor = await self.db.execute("""SELECT o.user_id, o.guild_id, o.channel_id, COALESCE(c.name, '#' || o.channel_id),
+                                                     o.date, o.seconds, o.is_counting
+                                              FROM all_online o LEFT JOIN channels c USING (channel_id)
+                                              WHERE o.date BETWEEN ? AND ?""", (first, last))
+            crc, rows = await self.archive.prepare(month, list(await cursor.fetchall()))
+            try:
+                await self.db.execute("DELETE FROM all_online WHERE date BETWEEN ? AND ?", (first, last))
+                await self.db.execute("INSERT INTO online_archive_log (month, crc, rows, archived_at) VALUES (?, ?, ?, ?)",
+                                      (month, crc, rows, int(time.time())))
+                await self.db.commit()
+            except Exception:
+                await self.db.rollback()
+                raise
+            self.archive.commit(month)
+            archived[month] = rows
+        return archived
+
+    async def dump(self):
+        queries = {
+            'channels': "SELECT channel_id, guild_id, name, is_counting, updated_at FROM channels",
+            'channel_names': "SELECT channel_id, name, since FROM channel_names",
+            'classifications': "SELECT channel_id, guild_id, is_counting, reason, changed_at FROM channel_classifications",
+            'current': "SELECT user_id, guild_id, channel_id, join_time, is_counting, credited_until FROM current_online",
+            'online': "SELECT user_id, guild_id, channel_id, NULL, date, seconds, is_counting FROM all_online",
+            'sessions': "SELECT user_id, guild_id, channel_id, started_at, ended_at, is_counting FROM online_sessions",
+        }
+        for kind, query in queries.items():
+            async with self.db.execute(query) as cursor:
+                while rows := await cursor.fetchmany(5000):
+                    yield kind, list(rows)
+            if kind == 'online':
+                for month in sorted(self.archive.months):
+                    yield kind, (await self.archive.load(month)).rows()
+
+    async def load(self, kind: str, rows: list[tuple]) -> None:
+        if kind == 'channels':
+            await self.db.executemany('''INSERT OR REPLACE INTO channels (channel_id, guild_id, name, is_counting, updated_at)
+                                         VALUES (?, ?, ?, ?, ?)''', rows)
+        elif kind == 'channel_names':
+            await self.db.executemany("INSERT INTO channel_names (channel_id, name, since) VALUES (?, ?, ?)", rows)
+        elif kind == 'classifications':
+            await self.db.executemany('''INSERT INTO channel_classifications (channel_id, guild_id, is_counting, reason, changed_at)
+                                         VALUES (?, ?, ?, ?, ?)''', rows)
+        elif kind == 'current':
+            await self.db.executemany('''INSERT OR REPLACE INTO current_online (user_id, guild_id, channel_id, join_time,
+                                         is_counting, credited_until) VALUES (?, ?, ?, ?, ?, ?)''', rows)
+        elif kind == 'online':
+            await self._add_buckets([(user_id, guild_id, channel_id, date, seconds, is_counting)
+                                     for user_id, guild_id, channel_id, _, date, seconds, is_counting in rows])
+        elif kind == 'sessions':
+            await self.db.executemany('''INSERT INTO online_sessions (user_id, guild_id, channel_id, started_at, ended_at, is_counting)
+                                         VALUES (?, ?, ?, ?, ?, ?)''', rows)
+        await self.db.commit()
@@ -7,13 +7,16 @@ from dataclasses import dataclass, asdict
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+
+from database.indexes import registry
 
 if typing.TYPE_CHECKING:
     from database.actions.general import Actions
     from database.actions.action import Act
 
 
-@dataclass
+@dataclass(slots=True)
 class Ban:
     user: int
     type: Literal['global', 'local']
@@ -52,6 +55,8 @@ class Bans:
     def __init__(self, collection: MotorCollection, actions: 'Actions'):
         self._collection = collection
         self._actions = actions
+        registry.declare(self._collection, [IndexModel([('user', 1), ('type', 1), ('guild', 1)]), IndexModel('action')],
+                         probes=[{'user': 0, 'type': 'global'}, {'user': 0, 'type': 'local', 'guild': 0}, {'action': 0}])
         self._expiration_callback: Optional[Callable[[Ban], Awaitable[None]]] = None
         self.current: list[Ban] = []
 
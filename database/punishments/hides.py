@@ -4,6 +4,9 @@ from dataclasses import dataclass, asdict
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+
+from database.indexes import registry
 
 if typing.TYPE_CHECKING:
     from database.actions.general import Actions
@@ -33,6 +36,7 @@ class Hides:
     def __init__(self, collection: MotorCollection, actions: 'Actions'):
         self._collection = collection
         self._actions = actions
+        registry.declare(self._collection, [IndexModel([('user', 1), ('guild', 1)])], probes=[{'user': 0, 'guild': 0}])
         self.current: list[Hide] = []
 
     async def load(self):
@@ -9,13 +9,16 @@ import discord
 from discord import Object, app_commands
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+
+from database.indexes import registry
 
 if typing.TYPE_CHECKING:
     from database.actions.general import Actions
     from database.actions.action import Act
 
 
-@dataclass
+@dataclass(slots=True)
 class Mute:
     user: int
     type: Literal['voice', 'text', 'full']
@@ -58,6 +61,8 @@ class Mutes:
     def __init__(self, collection: MotorCollection, actions: 'Actions'):
         self._collection = collection
         self._actions = actions
+        registry.declare(self._collection, [IndexModel([('user', 1), ('type', 1), ('guild', 1)])],
+                         probes=[{'user': 0, 'type': 'text', 'guild': 0}])
         self._expiration_callback: Optional[Callable[[Mute], Awaitable[None]]] = None
         self.current: list[Mute] = []
 
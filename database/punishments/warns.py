@@ -5,6 +5,9 @@ from dataclasses import dataclass, asdict
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection as MotorCollection
+from pymongo import IndexModel
+
+from database.indexes import registry
 
 if typing.TYPE_CHECKING:
     from database.actions.general import Actions
@@ -42,6 +45,7 @@ class Warns:
     def __init__(self, collection: MotorCollection, actions: 'Actions'):
         self._collection = collection
         self._actions = actions
+        registry.declare(self._collection, [IndexModel([('user', 1), ('guild', 1)])], probes=[{'user': 0, 'guild': 0}])
 
     async def get(self, user: int) -> list[WarnInfo]:
         return [WarnInfo(**doc) async for doc in self._collection.find({'user': user})]
@@ -0,0 +1,45 @@
+import dataclasses
+import functools
+from typing import Any, Iterable
+
+
+class Record:
+    __slots__ = ()
+    _full: type
+    _defaults: dict[str, Any]
+
+    def __init__(self, doc: dict):
+        for name in self.__slots__:
+            setattr(self, name, doc.get(name, self._defaults.get(name)))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def to_full(self):
+        # Поля, не попавшие в проекцию, становятся значениями по умолчанию или None
+        values = {field.name: self._defaults.get(field.name) for field in dataclasses.fields(self._full)}
+        values.update((name, getattr(self, name)) for name in self.__slots__)
+        return self._full(**values)
+
+
+@functools.cache
+def record_type(cls: type, fields: tuple[str, ...]) -> type[Record]:
+    defaults = {field.name: field.default for field in dataclasses.fields(cls) if field.default is not dataclasses.MISSING}
+    return type(f'{cls.__name__}Record', (Record,), {'__slots__': fields, '_full': cls, '_defaults': defaults})
+
+
+def projection(fields: Iterable[str]) -> dict[str, int]:
+    fields = dict.fromkeys(fields, 1)
+    fields.setdefault('_id', 0)
+    return fields
+
+
+def reader(cls: type, fields: Iterable[str] | None):
+    # Без проекции документы собираются в полный dataclass, с ней - в лёгкую запись только с нужными полями
+    if fields is None:
+        return None, lambda doc: cls(**doc)
+    fields = tuple(fields)
+    return projection(fields), record_type(cls, fields)
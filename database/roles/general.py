@@ -1,9 +1,15 @@
+import asyncio
 import typing
 import datetime
 from functools import lru_cache
 
 from motor.motor_asyncio import AsyncIOMotorClient as MotorClient
+from pymongo import IndexModel
 
+from database.cache import ReadModelCache
+from database.counters import Counters
+from database.indexes import registry
+from database.moderator_stats import ModeratorDailyStats
 from database.roles.remove import RolesRemove
 from database.roles.request import RoleRequest
 
@@ -11,11 +17,27 @@ if typing.TYPE_CHECKING:
     from database.actions.general import Actions
 
 class Roles:
-    def __init__(self, client: MotorClient, actions: 'Actions'):
+    def __init__(self, client: MotorClient, actions: 'Actions', stats: ModeratorDailyStats, cache: ReadModelCache,
+                 counters: Counters):
         self._client = client
+        self.stats = stats
+        self.cache = cache
+        self.counters = counters
         self._db = self._client['Roles']
         self._col = self._db['Requests']
         self._remove_col = self._db['RemovedRoles']
+        self.counters.register('role_requests', self._col)
+        self.counters.register('role_removes', self._remove_col)
+        registry.declare(self._col, [
+            IndexModel([('guild', 1), ('user', 1), ('checked_at', 1)]),
+            IndexModel([('guild', 1), ('moderator', 1), ('sent_at', 1)]),
+            IndexModel([('guild', 1), ('checked_at', 1)]),
+        ], probes=[
+            {'id': 0}, {'user': 0, 'guild': 0, 'checked_at': None}, {'guild': 0, 'user': 0},
+            {'guild': 0, 'moderator': 0, 'counting': True, 'sent_at': {'$gte': datetime.datetime(2024, 1, 1)}},
+        ])
+        registry.declare(self._remove_col, [IndexModel([('guild', 1), ('moderator', 1), ('at', 1)])],
+                         probes=[{'guild': 0, 'moderator': 0, 'at': {'$gte': datetime.datetime(2024, 1, 1)}}])
         self.reasons_dict = {
             "/c 60": ('⏱️', "На скриншоте не видно точного времени."),
             "Номер сервера": ('🔢', "На скриншоте не видно номера сервера или он не совпадает."),
@@ -41,7 +63,7 @@ class Roles:
         return result is None
 
     async def add_request(self, user: int, guild: int, nickname: str, role: str, rang: int, status_message: int) -> RoleRequest:
-        req_id = (await self._col.count_documents({})) + 1
+        req_id = await self.counters.next('role_requests')
         req = RoleRequest(
             id=req_id, user=user, guild=guild, nickname=nickname, role=role, rang=rang, counting=True,
             approved=False, sent_at=datetime.datetime.now(datetime.timezone.utc), status_message=status_message
@@ -61,18 +83,25 @@ class Roles:
         else:
             self.nicknames_cache[(request.guild, request.user)] = [request.nickname]
 
+        checked_at = datetime.datetime.now(datetime.timezone.utc)
         await self._col.update_one(
             {'id': request_id},
             {'$set': {
-                'approved': approve, 'checked_at': datetime.datetime.now(datetime.timezone.utc),
+                'approved': approve, 'checked_at': checked_at,
                 'moderator': moderator, 'reason': reason
             }}
         )
+        self.cache.invalidate(('moderator', request.guild, moderator), ('moderator', request.guild, request.moderator))
+        if request.counting:
+            if request.checked_at:
+                await self.stats.add_role(request.guild, request.moderator, request.checked_at,
+                                          'approved' if request.approved else 'rejected', -1)
+            await self.stats.add_role(request.guild, moderator, checked_at, 'approved' if approve else 'rejected')
 
     async def review_request(self, reviewer: int, request_id: int, approve: bool, reason: str = None, partial: bool = False) -> None:
         update = {'$set': {'reviewer': reviewer}}
+        request = await self.get_request_by_id(request_id)
         if not approve:
-            request = await self.get_request_by_id(request_id)
             update['$set']['approved'] = not request.approved
             if not request.approved:
                 update['$set']['review_reason'] = reason
@@ -82,14 +111,24 @@ class Roles:
             update['$set']['counting'] = False
             update['$set']['review_reason'] = reason
         await self._col.update_one({'id': request_id}, update)
+        self.cache.invalidate(('moderator', request.guild, request.moderator))
+
+        if request.counting and request.checked_at and (not approve or partial):
+            await self.stats.add_role(request.guild, request.moderator, request.checked_at,
+                                      'approved' if request.approved else 'rejected', -1)
+            if not partial:
+                await self.stats.add_role(request.guild, request.moderator, request.checked_at,
+                                          'rejected' if request.approved else 'approved')
 
     async def remove_roles(self, user: int, guild: int, roles: list[str], moderator: int) -> RolesRemove:
         roles = sorted(roles)
-        remove_id = (await self._remove_col.count_documents({})) + 1
+        remove_id = await self.counters.next('role_removes')
         remove = RolesRemove(
             id=remove_id, user=user, guild=guild, roles=roles, at=datetime.datetime.now(datetime.timezone.utc), moderator=moderator
         )
         await self._remove_col.insert_one(remove.to_dict())
+        self.cache.invalidate(('moderator', guild, moderator))
+        await self.stats.add_role(guild, moderator, remove.at, 'removed')
         return remove
 
     async def moderator_work(self, guild: int, moderator: int, date_from: datetime.datetime, date_to: datetime.datetime = None) -> tuple[list[RoleRequest], list[RolesRemove]]:
@@ -100,6 +139,38 @@ class Roles:
         cursor_removes = self._remove_col.find({'guild': guild, 'moderator': moderator, 'at': {'$gte': date_from, '$lte': date_to or (date_from + datetime.timedelta(days=1))}})
         return [RoleRequest(**doc) async for doc in cursor_requests], [RolesRemove(**doc) async for doc in cursor_removes]
 
+    async def guilds(self) -> set[int]:
+        return set(await self._col.distinct('guild')) | set(await self._remove_col.distinct('guild'))
+
+    async def moderator_counts(self, guild: int, moderators: list[int] = None, date_from: datetime.datetime = None,
+                               date_to: datetime.datetime = None) -> tuple[list[tuple[int, str, bool, int]], list[tuple[int, str, int]]]:
+        requests_query = {'guild': guild, 'counting': True, 'checked_at': {'$ne': None}}
+        removes_query = {'guild': guild}
+        if moderators is not None:
+            requests_query['moderator'] = removes_query['moderator'] = {'$in': moderators}
+        if date_from:
+            date_from = date_from.replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+            if date_to:
+                date_to = date_to.replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+            requests_query['sent_at'] = removes_query['at'] = {'$gte': date_from, '$lte': date_to or (date_from + datetime.timedelta(days=1))}
+
+        def local_date(field: str) -> dict:
+            return {'$dateToString': {'format': '%Y-%m-%d', 'date': field, 'timezone': '+03:00'}}
+
+        requests, removes = await asyncio.gather(
+            self._col.aggregate([
+                {'$match': requests_query},
+                {'$group': {'_id': {'moderator': '$moderator', 'approved': '$approved', 'date': local_date('$checked_at')},
+                            'count': {'$sum': 1}}},
+            ]).to_list(None),
+            self._remove_col.aggregate([
+                {'$match': removes_query},
+                {'$group': {'_id': {'moderator': '$moderator', 'date': local_date('$at')}, 'count': {'$sum': 1}}},
+            ]).to_list(None)
+        )
+        return ([(doc['_id']['moderator'], doc['_id']['date'], bool(doc['_id']['approved']), doc['count']) for doc in requests],
+                [(doc['_id']['moderator'], doc['_id']['date'], doc['count']) for doc in removes])
+
     async def role_history(self, guild: int, user: int) -> list[RoleRequest]:
         return [RoleRequest(**doc) async for doc in self._col.find({'guild': guild, 'user': user})]
 
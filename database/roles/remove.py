@@ -8,7 +8,7 @@ from database.actions.action import Act
 from info.roles import RoleInfo, role_info
 
 
-@dataclass
+@dataclass(slots=True)
 class RolesRemove:
     id: int
     user: int
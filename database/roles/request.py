@@ -17,7 +17,7 @@ class RequestStatus(enum.IntEnum):
     UNDER_REVIEW = 3
 
 
-@dataclass
+@dataclass(slots=True)
 class RoleRequest:
     id: int
     user: int
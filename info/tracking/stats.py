@@ -1,27 +1,26 @@
 import datetime
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict
 
 from core import templates
 from database.online.features import date_range
 from core.templates import format_plural
-from database.roles.request import RoleRequest
 
 
 @dataclass
 class ModeratorStats:
-    punishments: Dict[str, List[any]]  # Replace 'any' with actual Action type if available
-    roles: Dict[str, List[RoleRequest]]
+    punishments: Dict[str, int]
+    roles: Dict[str, int]
     online_time: int
-    removed_roles: List[any]  # Replace 'any' with actual Role type if available
+    removed_roles: int
 
     @property
     def total_punishments(self) -> int:
-        return sum(len(actions) for actions in self.punishments.values())
+        return sum(self.punishments.values())
 
     @property
     def total_roles(self) -> float:
-        return len(self.roles.get("Одобрено", [])) + len(self.removed_roles) / 2
+        return self.roles.get("Одобрено", 0) + self.removed_roles / 2
 
     def format_stats(self, short=False) -> str:
         return (
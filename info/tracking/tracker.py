@@ -1,11 +1,15 @@
+import asyncio
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterable, Optional
 
 import discord
 
 from database import db
+from database.moderator_stats import DailyStats, ModeratorDailyStats
 from info.tracking.stats import ModeratorStats, MonthModeratorStats
 
+_role_keys = {'approved': 'Одобрено', 'rejected': 'Отклонено', 'removed': 'Снято'}
+
 
 class ModeratorTracker:
     def __init__(self, guild: discord.Guild):
@@ -18,88 +22,77 @@ class ModeratorTracker:
             end_date: Optional[datetime] = None,
             return_by_dates: bool = False
     ) -> ModeratorStats | MonthModeratorStats:
-        end_date = end_date or start_date
+        return (await self.get_team_stats([moderator_id], start_date, end_date, return_by_dates))[moderator_id]
 
-        punishments = await db.actions.by_moderator(
-            moderator_id,
-            counting=True,
-            guild=self.guild.id,
-            date_from=start_date,
-            date_to=end_date if end_date != start_date else None
-        )
+    async def get_team_stats(
+            self,
+            moderator_ids: Iterable[int],
+            start_date: datetime,
+            end_date: Optional[datetime] = None,
+            return_by_dates: bool = False
+    ) -> dict[int, ModeratorStats | MonthModeratorStats]:
+        end_date = end_date or start_date
+        moderator_ids = list(set(moderator_ids))
 
-        roles_give, roles_remove = await db.roles.moderator_work(
-            moderator=moderator_id,
-            guild=self.guild.id,
-            date_from=start_date,
-            date_to=end_date if end_date != start_date else None
+        daily, online = await asyncio.gather(
+            self._daily(moderator_ids, start_date, end_date),
+            db.online.get_team_info(moderator_ids, self.guild.id, start_date, end_date, True)
         )
 
-        online_info = None
-        if end_date == start_date:
-            online = await db.online.get_info(
-                is_open=True,
-                user_id=moderator_id,
-                guild_id=self.guild.id,
-                date=start_date.strftime('%Y-%m-%d')
+        date_stats = {moderator_id: {} for moderator_id in moderator_ids}
+        for moderator_id, dates in online.items():
+            for date, info in dates.items():
+                date_stats[moderator_id].setdefault(date, {})['online_time'] = info.total_seconds
+
+        for day in daily:
+            punishments = {action_type: count for action_type, count in day.punishments.items() if count}
+            roles = {_role_keys[key]: count for key, count in day.roles.items() if count}
+            if punishments or roles:
+                date_stats[day.moderator].setdefault(day.date, {}).update(punishments=punishments, roles=roles)
+
+        if return_by_dates:
+            return {
+                moderator_id: MonthModeratorStats(
+                    dates={
+                        date: ModeratorStats(
+                            punishments=stats.get('punishments', {}),
+                            roles={key: stats.get('roles', {}).get(key, 0) for key in _role_keys.values()},
+                            online_time=stats.get('online_time', 0),
+                            removed_roles=stats.get('roles', {}).get('Снято', 0)
+                        )
+                        for date, stats in sorted(dates.items())
+                    }
+                )
+                for moderator_id, dates in date_stats.items()
+            }
+
+        team = {}
+        for moderator_id, dates in date_stats.items():
+            punishments_dict, roles_dict, online_time = {}, {}, 0
+            for stats in dates.values():
+                online_time += stats.get('online_time', 0)
+                for action_type, count in stats.get('punishments', {}).items():
+                    punishments_dict[action_type] = punishments_dict.get(action_type, 0) + count
+                for key, count in stats.get('roles', {}).items():
+                    roles_dict[key] = roles_dict.get(key, 0) + count
+
+            team[moderator_id] = ModeratorStats(
+                punishments=punishments_dict,
+                roles=roles_dict,
+                online_time=online_time,
+                removed_roles=roles_dict.get('Снято', 0)
             )
-            online_time = online.total_seconds
-        else:
-            online_info = await db.online.get_diapason_info(
-                moderator_id,
-                self.guild.id,
-                start_date,
-                end_date if end_date != start_date else None,
-                True
-            )
-            online_time = sum(info.total_seconds for info in online_info.values())
-
-        if return_by_dates and online_info is not None:
-            date_stats = {}
-            for date, info in online_info.items():
-                date_stats.setdefault(date, {})['online_time'] = info.total_seconds
-
-            for action in punishments:
-                date = (action.at + timedelta(hours=3)).strftime('%Y-%m-%d')
-                date_stats.setdefault(date, {}).setdefault('punishments', {}).setdefault(action.type, []).append(action)
-
-            for role in roles_give:
-                date = (role.checked_at + timedelta(hours=3)).strftime('%Y-%m-%d')
-                key = 'Одобрено' if role.approved else 'Отклонено'
-                date_stats.setdefault(date, {}).setdefault('roles', {}).setdefault(key, []).append(role)
-
-            for role in roles_remove:
-                date = (role.at + timedelta(hours=3)).strftime('%Y-%m-%d')
-                date_stats.setdefault(date, {}).setdefault('roles', {}).setdefault('Снято', []).append(role)
-
-            return MonthModeratorStats(
-                dates={
-                    date: ModeratorStats(
-                        punishments=stats.get('punishments', {}),
-                        roles={'Одобрено': stats.get('roles', {}).get('Одобрено', []),
-                                 'Отклонено': stats.get('roles', {}).get('Отклонено', []),
-                                 'Снято': stats.get('roles', {}).get('Снято', [])},
-                        online_time=stats.get('online_time', 0),
-                        removed_roles=stats.get('roles', {}).get('Снято', [])
-                    )
-                    for date, stats in date_stats.items()
-                }
-            )
-
-        punishments_dict = {}
-        for action in punishments:
-            punishments_dict.setdefault(action.type, []).append(action)
-
-        roles_dict = {}
-        for role in roles_give:
-            key = 'Одобрено' if role.approved else 'Отклонено'
-            roles_dict.setdefault(key, []).append(role)
-        if roles_remove:
-            roles_dict['Снято'] = roles_remove
-
-        return ModeratorStats(
-            punishments=punishments_dict,
-            roles=roles_dict,
-            online_time=online_time,
-            removed_roles=roles_remove
+        return team
+
+    async def _daily(self, moderator_ids: list[int], start_date: datetime, end_date: datetime) -> list[DailyStats]:
+        if db.moderator_stats.ready:
+            return await db.moderator_stats.period(self.guild.id, moderator_ids, start_date, end_date)
+        date_to = end_date + timedelta(days=1)
+        punishments, (requests, removes) = await asyncio.gather(
+            db.actions.moderator_counts(self.guild.id, moderator_ids, start_date, date_to),
+            db.roles.moderator_counts(self.guild.id, moderator_ids, start_date, date_to)
         )
+        return list(ModeratorDailyStats.assemble(self.guild.id, punishments, requests, removes).values())
+
+    async def rebuild_daily_stats(self) -> int:
+        return await db.moderator_stats.rebuild(self.guild.id, db.actions, db.roles)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import config
+import core.bot  # noqa: F401 - разрывает циклический импорт database <-> buttons
+from database.online.general import OnlineDatabase
+
+
+class CheckpointLeaveTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.archive_path, config.online_archive_path = config.online_archive_path, os.path.join(self.directory.name, 'archive')
+        self.addCleanup(setattr, config, 'online_archive_path', self.archive_path)
+
+        self.guild = SimpleNamespace(id=10)
+        self.member = SimpleNamespace(id=2, guild=self.guild)
+        self.first = SimpleNamespace(id=5, name='first', guild=self.guild)
+        self.second = SimpleNamespace(id=6, name='second', guild=self.guild)
+
+    async def open(self, name: str, coalesce_window: float) -> OnlineDatabase:
+        db = OnlineDatabase(os.path.join(self.directory.name, f'{name}.sqlite'))
+        await db.init_db()
+        db.events.coalesce_window = coalesce_window
+        db.events.retries = 1
+        db.add_join_info(self.member, self.first, True)
+        session = db.current.get(self.member.id, self.guild.id)
+        session['join_time'] -= 600
+        session['credited_until'] -= 600
+        await db.events.flush()
+        return db
+
+    async def rejoin_during_checkpoint(self, db: OnlineDatabase, fail: bool) -> None:
+        apply = db.storage.apply
+
+        async def write(events):
+            db.add_leave_info(self.member, self.first)
+            db.add_join_info(self.member, self.second, True)
+            if fail:
+                raise RuntimeError('write failed')
+            await apply(events)
+
+        db.storage.apply = write
+        try:
+            await db.checkpoint()
+        except RuntimeError:
+            pass
+        finally:
+            db.storage.apply = apply
+        await db.events.flush()
+
+    async def stored(self, db: OnlineDatabase, query: str) -> list[tuple]:
+        async with db.storage.db.execute(query) as cursor:
+            return list(await cursor.fetchall())
+
+    async def test_leave_and_rejoin_while_checkpoint_is_written(self):
+        for coalesce_window in (0, 60):
+            for fail in (False, True):
+                with self.subTest(coalesce_window=coalesce_window, fail=fail):
+                    db = await self.open(f'{coalesce_window}-{fail}', coalesce_window)
+                    try:
+                        await self.rejoin_during_checkpoint(db, fail)
+                        self.assertEqual(await self.stored(db, 'SELECT user_id, channel_id FROM current_online'),
+                                         [(self.member.id, self.second.id)])
+                        total, = await self.stored(db, 'SELECT SUM(seconds) FROM all_online')
+                        self.assertAlmostEqual(total[0], 600, delta=2)
+                        self.assertEqual(db.current.get(self.member.id, self.guild.id)['channel_id'], self.second.id)
+                    finally:
+                        await db.events.close()
+                        await db.storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()